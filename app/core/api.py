@@ -1,33 +1,193 @@
+import contextvars
 import os
+import threading
+import time
 import requests
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from .cache import TTLCache
+from . import metrics
+from . import timing
+from . import ratelimit
+from .shared_cache import get_shared_cache
 
 load_dotenv(dotenv_path='env')
 API_TOKEN = os.getenv('API_CARDTRADER')
 
+# One pooled session shared by every caller so concurrent fetches reuse connections
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '16'))
+session = requests.Session()
+session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE))
+
+# Blueprint exports per expansion: expansion_id -> (fetched_at, data)
+BLUEPRINT_CACHE_TTL = int(os.getenv('BLUEPRINT_CACHE_TTL', str(24 * 3600)))
+blueprint_cache = TTLCache(maxsize=64, ttl=BLUEPRINT_CACHE_TTL)
+
+# Last marketplace snapshot per blueprint: blueprint_id -> (fetched_at, data)
+LISTING_CACHE_TTL = int(os.getenv('LISTING_CACHE_TTL', '3600'))
+listing_cache = TTLCache(maxsize=int(os.getenv('LISTING_CACHE_SIZE', '5000')), ttl=LISTING_CACHE_TTL)
+# Blueprints with a listing fetch in progress, so cache-tolerant callers wait instead of refetching
+_inflight_lock = threading.Lock()
+_inflight = {}
+_listing_listeners = []
+
+def add_listing_listener(callback):
+    """Registers callback(blueprint_id, listings, fetched_at) for every listing snapshot that enters the cache."""
+    _listing_listeners.append(callback)
+
+def _ingest_listings(blueprint_id, data, fetched_at):
+    for callback in _listing_listeners:
+        callback(blueprint_id, data.get(str(blueprint_id), []), fetched_at)
+
+# Counters of the count_calls blocks the current context runs in. Per context rather than
+# process-wide, so concurrent runs (server jobs, the refresh daemon) only see their own calls.
+_call_counters = contextvars.ContextVar('api_call_counters', default=())
+
+class CallCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def add(self):
+        with self._lock:
+            self.calls += 1
+
+@contextmanager
+def count_calls():
+    """
+    Counts the upstream requests (retries included) made inside the block, and in worker
+    threads that run a copy of its context. Yields a CallCounter; read `.calls`.
+    """
+    counter = CallCounter()
+    token = _call_counters.set(_call_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _call_counters.reset(token)
+
 def get_headers():
     return {"Authorization": f"Bearer {API_TOKEN}"}
 
-def fetch_blueprints(expansion_id):
+def _cached(cache, key, max_age, layer):
+    """
+    Cached data for key if it was fetched within max_age seconds, else None.
+    Falls back to the cross-process cache so workers share each other's fetches.
+    """
+    entry = cache.get(key)
+    if entry is None or time.time() - entry[0] > max_age:
+        shared = get_shared_cache()
+        entry = shared.get(layer, key, max_age) if shared else None
+        if entry:
+            cache.set(key, entry)
+            if layer == "listings":
+                # Another worker's fetch is new to this process's listeners too
+                _ingest_listings(key, entry[1], entry[0])
+    hit = entry is not None
+    metrics.cache_requests.inc(layer=layer, result="hit" if hit else "miss")
+    return entry[1] if hit else None
+
+def _store(cache, key, data, layer):
+    entry = (time.time(), data)
+    cache.set(key, entry)
+    if layer == "listings":
+        _ingest_listings(key, data, entry[0])
+    shared = get_shared_cache()
+    if shared:
+        shared.set(layer, key, data, stored_at=entry[0])
+
+def _get(endpoint, url, params=None, retries=3):
+    """
+    GET against the CardTrader API through the shared rate limiter, recording latency
+    and status under `endpoint`. A 429 drains the bucket for every process and retries.
+    """
+    for attempt in range(retries + 1):
+        ratelimit.acquire()
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = session.get(url, headers=get_headers(), params=params)
+            status = response.status_code
+            if status == 429 and attempt < retries:
+                ratelimit.penalize(float(response.headers.get("Retry-After", 1)))
+                continue
+            response.raise_for_status()
+            return response.json()
+        finally:
+            for counter in _call_counters.get():
+                counter.add()
+            metrics.upstream_requests.inc(endpoint=endpoint, status=status)
+            metrics.upstream_latency.observe(time.perf_counter() - start, endpoint=endpoint)
+
+@timing.timed("blueprint_fetch")
+def fetch_blueprints(expansion_id, max_age=None):
+    """
+    Blueprint export for an expansion. With max_age (seconds) a cached export that recent
+    is returned as the same list object, so callers can detect changes by identity.
+    """
+    if max_age:
+        cached = _cached(blueprint_cache, expansion_id, max_age, "blueprints")
+        if cached is not None:
+            return cached
+
     url = "https://api.cardtrader.com/api/v2/blueprints/export"
-    response = requests.get(url, headers=get_headers(), params={"expansion_id": expansion_id})
-    response.raise_for_status()
-    return response.json()
+    data = _get("blueprints/export", url, {"expansion_id": expansion_id})
+    _store(blueprint_cache, expansion_id, data, "blueprints")
+    return data
+
+@timing.timed("listing_fetch")
+def fetch_marketplace_products(blueprint_id, max_age=None):
+    """
+    Listings for a blueprint. With max_age (seconds) a cached snapshot that recent is
+    reused instead of calling the API; fresh responses always refresh the cache.
+    """
+    if max_age:
+        cached = _cached(listing_cache, blueprint_id, max_age, "listings")
+        if cached is not None:
+            return cached
+        with _inflight_lock:
+            pending = _inflight.get(blueprint_id)
+        if pending and pending.wait(30):
+            entry = listing_cache.get(blueprint_id)
+            if entry and time.time() - entry[0] <= max_age:
+                return entry[1]
+
+    done = threading.Event()
+    with _inflight_lock:
+        _inflight[blueprint_id] = done
+    try:
+        url = "https://api.cardtrader.com/api/v2/marketplace/products"
+        data = _get("marketplace/products", url, {"blueprint_id": blueprint_id})
+        _store(listing_cache, blueprint_id, data, "listings")
+        return data
+    finally:
+        with _inflight_lock:
+            if _inflight.get(blueprint_id) is done:
+                del _inflight[blueprint_id]
+        done.set()
 
-def fetch_marketplace_products(blueprint_id):
+@timing.timed("listing_fetch")
+def fetch_expansion_products(expansion_id):
+    """
+    Listings for every blueprint of an expansion in one call: {str(blueprint_id): [listings]}.
+    Each blueprint's slice also seeds the per-blueprint listing cache, so later
+    fetch_marketplace_products calls with a max_age are hits.
+    """
     url = "https://api.cardtrader.com/api/v2/marketplace/products"
-    response = requests.get(url, headers=get_headers(), params={"blueprint_id": blueprint_id})
-    response.raise_for_status()
-    return response.json()
+    data = _get("marketplace/products", url, {"expansion_id": expansion_id})
+    fetched_at = time.time()
+    snapshots = {int(bp_id): {bp_id: listings} for bp_id, listings in data.items()}
+    for bp_id, snapshot in snapshots.items():
+        listing_cache.set(bp_id, (fetched_at, snapshot))
+        _ingest_listings(bp_id, snapshot, fetched_at)
+    shared = get_shared_cache()
+    if shared and snapshots:
+        shared.set_many("listings", snapshots, stored_at=fetched_at)
+    return data
 
 def fetch_wishlists():
     url = "https://api.cardtrader.com/api/v2/wishlists"
-    response = requests.get(url, headers=get_headers())
-    response.raise_for_status()
-    return response.json()
+    return _get("wishlists", url)
 
 def fetch_wishlist_details(wishlist_id):
     url = f"https://api.cardtrader.com/api/v2/wishlists/{wishlist_id}"
-    response = requests.get(url, headers=get_headers())
-    response.raise_for_status()
-    return response.json()
+    return _get("wishlists/:id", url)
@@ -0,0 +1,57 @@
+import heapq
+import math
+import os
+
+# Weight of the newest observation in the moving average/variance
+BASELINE_ALPHA = float(os.getenv('BASELINE_ALPHA', '0.2'))
+# Step of the streaming percentile estimates, as a fraction of the current average
+BASELINE_QUANTILE_RATE = float(os.getenv('BASELINE_QUANTILE_RATE', '0.05'))
+# Observations needed before a blueprint's history is trusted over its current snapshot
+BASELINE_MIN_SAMPLES = int(os.getenv('BASELINE_MIN_SAMPLES', '3'))
+
+QUANTILES = {"p10": 0.1, "p50": 0.5, "p90": 0.9}
+
+def market_floor(prices, depth=5):
+    """Observed floor of one snapshot: median of the depth+1 cheapest prices, so a single outlier barely moves it."""
+    lowest = heapq.nsmallest(depth + 1, prices)
+    mid = len(lowest) // 2
+    return lowest[mid] if len(lowest) % 2 else (lowest[mid - 1] + lowest[mid]) / 2
+
+def update(stats, value):
+    """
+    Folds one observation (cents) into a blueprint's running statistics in O(1):
+    exponentially weighted mean and variance plus stochastic-approximation percentiles.
+    `stats` is None for a blueprint seen for the first time.
+    """
+    if not stats:
+        return {"ewma": value, "ewm_var": 0.0, "p10": value, "p50": value, "p90": value, "samples": 1}
+
+    stats = dict(stats)
+    diff = value - stats["ewma"]
+    increment = BASELINE_ALPHA * diff
+    stats["ewma"] += increment
+    stats["ewm_var"] = (1 - BASELINE_ALPHA) * (stats["ewm_var"] + diff * increment)
+
+    step = BASELINE_QUANTILE_RATE * stats["ewma"]
+    for name, q in QUANTILES.items():
+        if value > stats[name]:
+            stats[name] += step * q
+        elif value < stats[name]:
+            stats[name] -= step * (1 - q)
+    stats["samples"] += 1
+    return stats
+
+def score(stats, price):
+    """
+    How unusual `price` (cents) is against a blueprint's history: ratio to the median floor
+    (p50), z-score below the average and whether it undercuts the 10th percentile.
+    """
+    std = math.sqrt(stats["ewm_var"])
+    # The p10-p90 band spans about 2.56 standard deviations, so a variance the average has
+    # just smoothed flat can't make every cent look unusual; the 1% floor covers flat histories
+    std = max(std, (stats["p90"] - stats["p10"]) / 2.56, stats["ewma"] * 0.01, 1)
+    return {
+        "ratio": price / stats["p50"] if stats["p50"] else 1.0,
+        "z": (stats["ewma"] - price) / std,
+        "below_p10": price < stats["p10"]
+    }
@@ -0,0 +1,366 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import api
+
+# Shipping model: every seller ships its own parcel, while all CardTrader Zero listings
+# travel together through the hub as a single parcel
+CART_SHIPPING_CENTS = int(os.getenv('CART_SHIPPING_CENTS', '500'))
+CART_ZERO_SHIPPING_CENTS = int(os.getenv('CART_ZERO_SHIPPING_CENTS', '600'))
+# "auto" switches to the exact search when at most this many shipping groups are worth considering
+CART_EXACT_MAX_SELLERS = int(os.getenv('CART_EXACT_MAX_SELLERS', '20'))
+# Branch-and-bound node budget; past it the best cart found so far is returned
+CART_EXACT_MAX_NODES = int(os.getenv('CART_EXACT_MAX_NODES', '20000'))
+CART_FETCH_WORKERS = int(os.getenv('CART_FETCH_WORKERS', '8'))
+CART_LISTING_MAX_AGE = int(os.getenv('CART_LISTING_MAX_AGE', '900'))
+
+ZERO = "zero"
+# Cost of a copy the open groups can't supply; large enough that covering it always wins
+_MISSING = 10 ** 9
+
+def _group_key(listing, use_zero):
+    user = listing.get('user', {})
+    if use_zero and user.get('can_sell_via_hub'):
+        return ZERO
+    return user.get('id', user.get('username'))
+
+def _card_cost(offers, need, open_groups):
+    """Cheapest way to cover `need` copies from offers of open groups, missing copies at _MISSING each."""
+    cost = 0
+    for price, qty, g, _ in offers:
+        if need <= 0:
+            break
+        if g in open_groups:
+            take = min(qty, need)
+            cost += take * price
+            need -= take
+    return cost + need * _MISSING
+
+def build_offers(game, listings_by_bp, cart, zero_only=False, lang_target=None, use_zero=True,
+                 seller_shipping=CART_SHIPPING_CENTS, zero_shipping=CART_ZERO_SHIPPING_CENTS):
+    """
+    Prepares a cart ({blueprint_id: quantity}) for the search.
+    Returns (cards, groups, shipping): cards are (blueprint_id, wanted, coverable, offers)
+    with offers as (price_cents, quantity, group index, listing) sorted by price; groups are
+    the shipping group keys (seller IDs or ZERO) and shipping their cost in cents.
+    Offers that can never be part of an optimal cart are dropped: one priced above the
+    n-th cheapest copy plus the dearest shipping fee always loses to opening that copy's group.
+    """
+    index, groups, shipping = {}, [], []
+    cards = []
+    for bp_id, wanted in cart.items():
+        listings = game.filter_listings(listings_by_bp.get(bp_id, []), zero_only, lang_target)
+        priced = sorted(
+            (l for l in listings if l.get('price_cents') is not None and l.get('quantity', 1) > 0),
+            key=lambda l: l['price_cents']
+        )
+        coverable = min(wanted, sum(l.get('quantity', 1) for l in priced))
+
+        cutoff, counted = None, 0
+        for l in priced:
+            counted += l.get('quantity', 1)
+            if counted >= coverable:
+                cutoff = l['price_cents'] + max(seller_shipping, zero_shipping)
+                break
+
+        offers = []
+        for l in priced:
+            if cutoff is not None and l['price_cents'] > cutoff:
+                break
+            key = _group_key(l, use_zero)
+            if key not in index:
+                index[key] = len(groups)
+                groups.append(key)
+                shipping.append(zero_shipping if key == ZERO else seller_shipping)
+            offers.append((l['price_cents'], l.get('quantity', 1), index[key], l))
+        cards.append((bp_id, wanted, coverable, offers))
+    return cards, groups, shipping
+
+def _total(cards, shipping, open_groups):
+    return sum(shipping[g] for g in open_groups) + sum(_card_cost(o, n, open_groups) for _, _, n, o in cards)
+
+def _cheapest_groups(cards):
+    """Groups used when every card simply takes its cheapest copies (the old greedy rule)."""
+    used = set()
+    for _, _, need, offers in cards:
+        for _, qty, g, _ in offers:
+            if need <= 0:
+                break
+            used.add(g)
+            need -= qty
+    return used
+
+def _construct(cards, shipping):
+    """Greedy start: each card, most constrained first, opens the groups that lower its cost the most."""
+    open_groups = set()
+    for _, _, need, offers in sorted(cards, key=lambda c: len(c[3])):
+        by_group = {}
+        for offer in offers:
+            by_group.setdefault(offer[2], []).append(offer)
+        # Each candidate is priced from the open groups' offers plus its own, not the whole list
+        usable = [o for o in offers if o[2] in open_groups]
+        current = _card_cost(usable, need, open_groups)
+        while True:
+            best, best_cost = None, current
+            for g in by_group.keys() - open_groups:
+                candidate = sorted(usable + by_group[g], key=lambda o: o[0])
+                cost = _card_cost(candidate, need, open_groups | {g}) + shipping[g]
+                if cost < best_cost:
+                    best, best_cost = g, cost
+            if best is None:
+                break
+            open_groups.add(best)
+            usable = sorted(usable + by_group[best], key=lambda o: o[0])
+            current = best_cost - shipping[best]
+    return open_groups
+
+def _local_search(cards, shipping, open_groups):
+    """Drops and adds single groups while that lowers the total. Only cards a group touches are repriced."""
+    open_groups = set(open_groups)
+    touching = {}
+    for i, (_, _, _, offers) in enumerate(cards):
+        for _, _, g, _ in offers:
+            touching.setdefault(g, set()).add(i)
+    costs = [_card_cost(o, n, open_groups) for _, _, n, o in cards]
+
+    def try_move(g, opening):
+        if opening:
+            open_groups.add(g)
+        else:
+            open_groups.discard(g)
+        changed = {i: _card_cost(cards[i][3], cards[i][2], open_groups) for i in touching[g]}
+        delta = sum(changed[i] - costs[i] for i in changed) + (shipping[g] if opening else -shipping[g])
+        if delta < 0:
+            for i, cost in changed.items():
+                costs[i] = cost
+            return True
+        if opening:
+            open_groups.discard(g)
+        else:
+            open_groups.add(g)
+        return False
+
+    improved = True
+    while improved:
+        improved = False
+        # Expensive parcels first: they are the ones worth consolidating away
+        for g in sorted(open_groups, key=lambda g: -shipping[g]):
+            improved |= try_move(g, False)
+        for g in touching:
+            if g not in open_groups:
+                improved |= try_move(g, True)
+    return open_groups
+
+def _card_fill(offers, need, open_groups):
+    """_card_cost plus the index of the last offer it had to look at."""
+    cost = 0
+    for i, (price, qty, g, _) in enumerate(offers):
+        if need <= 0:
+            return cost, i - 1
+        if g in open_groups:
+            take = min(qty, need)
+            cost += take * price
+            need -= take
+    return cost + need * _MISSING, len(offers)
+
+def _exact(cards, shipping, upper_groups, max_nodes):
+    """
+    Branch and bound over open/closed decisions per group. The bound prices every card with
+    all groups not yet closed, charges shipping for groups already opened, and adds the
+    cheapest fee for each parcel still unavoidable: a card whose opened groups fall short
+    needs at least (missing copies / most copies one group offers it) more of them.
+    Depth-first with an explicit stack, so carts with thousands of groups can't exhaust the
+    recursion limit, and incremental: opening a group only adds its shipping, and closing
+    one reprices just the cards whose current fill reaches one of its offers.
+    Returns (open groups, proven optimal).
+    """
+    touching = {}  # group -> {card index: index of the group's first offer for that card}
+    copies = {}    # group -> {card index: copies it offers of that card}
+    for i, (_, _, _, offers) in enumerate(cards):
+        for position, (_, qty, g, _) in enumerate(offers):
+            touching.setdefault(g, {}).setdefault(i, position)
+            copies.setdefault(g, {})[i] = copies.get(g, {}).get(i, 0) + qty
+    groups = sorted(touching, key=lambda g: -len(touching[g]))
+    best_total, best_groups = _total(cards, shipping, upper_groups), set(upper_groups)
+    if not groups:
+        return best_groups, True
+
+    most = [1] * len(cards)
+    for per_card in copies.values():
+        for i, qty in per_card.items():
+            most[i] = max(most[i], qty)
+    min_shipping = min(shipping[g] for g in groups)
+    covered = [0] * len(cards)  # copies of each card the opened groups offer
+
+    def parcels_needed(i):
+        return -(-max(0, cards[i][2] - covered[i]) // most[i])
+
+    needed = {}  # parcels still needed -> number of cards needing that many
+    for i in range(len(cards)):
+        needed[parcels_needed(i)] = needed.get(parcels_needed(i), 0) + 1
+
+    def cover(g, sign):
+        for i, qty in copies[g].items():
+            before = parcels_needed(i)
+            covered[i] += sign * qty
+            after = parcels_needed(i)
+            if before != after:
+                needed[before] -= 1
+                if not needed[before]:
+                    del needed[before]
+                needed[after] = needed.get(after, 0) + 1
+
+    opened, allowed = set(), set(groups)
+    fills = [_card_fill(o, n, allowed) for _, _, n, o in cards]  # (cost, last offer looked at)
+    card_total, shipping_total = sum(cost for cost, _ in fills), 0
+    saved = []  # repriced cards' previous fills, one entry per closed group
+    nodes = 0
+    stack = [("visit", 0)]
+    while stack:
+        op, arg = stack.pop()
+        if op == "visit":
+            nodes += 1
+            if nodes > max_nodes:
+                return best_groups, False
+            bound = shipping_total + card_total
+            if bound + max(needed) * min_shipping >= best_total:
+                continue
+            if arg == len(groups):
+                best_total, best_groups = bound, set(opened)
+                continue
+            g = groups[arg]
+            # Popped in reverse: open g and descend, undo, then close g and descend, undo
+            stack += [("reopen", g), ("visit", arg + 1), ("close", g), ("unopen", g), ("visit", arg + 1), ("open", g)]
+        elif op == "open":
+            opened.add(arg)
+            shipping_total += shipping[arg]
+            cover(arg, 1)
+        elif op == "unopen":
+            opened.discard(arg)
+            shipping_total -= shipping[arg]
+            cover(arg, -1)
+        elif op == "close":
+            allowed.discard(arg)
+            previous = {i: fills[i] for i, first in touching[arg].items() if first <= fills[i][1]}
+            for i in previous:
+                fills[i] = _card_fill(cards[i][3], cards[i][2], allowed)
+                card_total += fills[i][0] - previous[i][0]
+            saved.append(previous)
+        else:  # reopen
+            allowed.add(arg)
+            for i, fill in saved.pop().items():
+                card_total += fill[0] - fills[i][0]
+                fills[i] = fill
+    return best_groups, True
+
+def solve(cards, groups, shipping, mode="auto", max_nodes=CART_EXACT_MAX_NODES):
+    """
+    Chooses which shipping groups to buy from. Returns (open groups, mode used, optimal).
+    "heuristic" keeps the better of two greedy starts after local search; "exact" proves the
+    optimum by branch and bound, stopping at the best cart found within max_nodes (optimal
+    is then False). "auto" runs the exact search only when at most CART_EXACT_MAX_SELLERS
+    groups are in play and the heuristic otherwise.
+    """
+    candidates = [_local_search(cards, shipping, start) for start in (_cheapest_groups(cards), _construct(cards, shipping))]
+    best = min(candidates, key=lambda open_groups: _total(cards, shipping, open_groups))
+
+    if mode == "auto":
+        mode = "exact" if len({o[2] for c in cards for o in c[3]}) <= CART_EXACT_MAX_SELLERS else "heuristic"
+    if mode == "exact":
+        best, optimal = _exact(cards, shipping, best, max_nodes)
+        return best, mode, optimal
+    return best, mode, False
+
+def _result(cards, groups, shipping, open_groups):
+    """Per-card picks and per-group parcels for the chosen open groups."""
+    items, parcels = [], {}
+    items_cents = 0
+    currency = None
+    for bp_id, wanted, coverable, offers in cards:
+        need, cost, picks = coverable, 0, []
+        for price, qty, g, listing in offers:
+            if need <= 0:
+                break
+            if g not in open_groups:
+                continue
+            take = min(qty, need)
+            need -= take
+            cost += take * price
+            currency = listing.get('price_currency', currency)
+            pick = {
+                "blueprint_id": bp_id,
+                "listing_id": listing.get('id'),
+                "qty": take,
+                "price": price / 100,
+                "seller": listing.get('user', {}).get('username')
+            }
+            picks.append(pick)
+            parcel = parcels.setdefault(g, {"items": [], "subtotal": 0})
+            parcel["items"].append(pick)
+            parcel["subtotal"] += take * price
+        items_cents += cost
+        items.append({
+            "blueprint_id": bp_id,
+            "qty": coverable - need,
+            "missing": wanted - (coverable - need),
+            "cost": cost / 100,
+            "listings": picks
+        })
+
+    sellers = []
+    for g, parcel in sorted(parcels.items(), key=lambda p: -p[1]["subtotal"]):
+        key = groups[g]
+        sellers.append({
+            "seller": "CardTrader Zero" if key == ZERO else parcel["items"][0]["seller"],
+            "zero": key == ZERO,
+            "shipping": shipping[g] / 100,
+            "subtotal": parcel["subtotal"] / 100,
+            "items": len(parcel["items"])
+        })
+    shipping_cents = sum(shipping[g] for g in parcels)
+    return {
+        "total": (items_cents + shipping_cents) / 100,
+        "items_cost": items_cents / 100,
+        "shipping": shipping_cents / 100,
+        "currency": currency or "EUR",
+        "missing": sum(i["missing"] for i in items),
+        "sellers": sellers,
+        "items": items
+    }
+
+def fetch_listings(blueprint_ids, max_age=CART_LISTING_MAX_AGE):
+    """{blueprint_id: listings} fetched concurrently; a failed blueprint has no listings."""
+    def fetch(bp_id):
+        try:
+            return bp_id, api.fetch_marketplace_products(bp_id, max_age=max_age).get(str(bp_id), [])
+        except Exception:
+            return bp_id, []
+
+    with ThreadPoolExecutor(max_workers=CART_FETCH_WORKERS) as pool:
+        return dict(pool.map(fetch, list(blueprint_ids)))
+
+def optimize(game, cart, zero_only=False, lang_target=None, mode="auto", use_zero=True,
+             seller_shipping=CART_SHIPPING_CENTS, zero_shipping=CART_ZERO_SHIPPING_CENTS,
+             listings_by_bp=None, max_nodes=CART_EXACT_MAX_NODES):
+    """
+    Cheapest cart for {blueprint_id: quantity} including shipping: one fee per seller
+    parcel, or a single Zero parcel for hub-eligible listings when use_zero.
+    Listings are fetched unless `listings_by_bp` is given. Also reports the old
+    cheapest-copy-per-card cart ("greedy_total") for comparison.
+    """
+    if listings_by_bp is None:
+        listings_by_bp = fetch_listings(cart)
+
+    begin = time.perf_counter()
+    cards, groups, shipping = build_offers(
+        game, listings_by_bp, cart, zero_only, lang_target, use_zero, seller_shipping, zero_shipping
+    )
+    open_groups, mode, optimal = solve(cards, groups, shipping, mode, max_nodes)
+    result = _result(cards, groups, shipping, open_groups)
+    greedy = _result(cards, groups, shipping, _cheapest_groups(cards))
+    result.update(
+        mode=mode, optimal=optimal, greedy_total=greedy["total"],
+        savings=round(greedy["total"] - result["total"], 2),
+        seconds=round(time.perf_counter() - begin, 4)
+    )
+    return result
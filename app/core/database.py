@@ -1,9 +1,33 @@
 import sqlite3
 import os
 import json
+import functools
+import time
+import uuid
+from datetime import datetime
+from . import metrics
+from . import timing
 
 DB_NAME = "prices.db"
 
+# Callbacks run after every save_price, used to invalidate in-process caches
+_write_listeners = []
+
+def add_write_listener(callback):
+    """Registers callback(game, rarity, domain, quantity, zero_only, language, expansion, foil, inventory_hash)."""
+    _write_listeners.append(callback)
+
+def _timed(query):
+    """Records the wrapped function's duration as a SQLite query metric and request phase."""
+    phase = "db_write" if query.startswith("save") else "db_read"
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.db_query_latency.time(query=query), timing.span(phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
 def init_db():
     conn = sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
@@ -36,40 +60,260 @@ def init_db():
         cursor.execute('ALTER TABLE price_history ADD COLUMN foil BOOLEAN DEFAULT 0')
     if 'items_json' not in columns:
         cursor.execute('ALTER TABLE price_history ADD COLUMN items_json TEXT')
+    if 'inventory_hash' not in columns:
+        # Fingerprint of the collection file a row was priced against (NULL = no inventory)
+        cursor.execute('ALTER TABLE price_history ADD COLUMN inventory_hash TEXT')
+    if 'sweep_id' not in columns:
+        # Cron sweep that wrote the row and the cell within it; NULL for on-demand prices
+        cursor.execute('ALTER TABLE price_history ADD COLUMN sweep_id TEXT')
+        cursor.execute('ALTER TABLE price_history ADD COLUMN sweep_cell TEXT')
+    if 'fingerprint' not in columns:
+        # Hash of the listings a row was priced from, to detect unchanged cells
+        cursor.execute('ALTER TABLE price_history ADD COLUMN fingerprint TEXT')
+
+    # A sweep writes each cell at most once, however many times it is resumed
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_price_history_sweep_cell
+        ON price_history (sweep_id, sweep_cell) WHERE sweep_id IS NOT NULL
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sweeps (
+            id TEXT PRIMARY KEY,
+            game TEXT,
+            params_json TEXT,
+            status TEXT,
+            created DATETIME DEFAULT CURRENT_TIMESTAMP,
+            finished DATETIME
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sweep_cells (
+            sweep_id TEXT,
+            cell TEXT,
+            status TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (sweep_id, cell)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS listing_stats (
+            game TEXT,
+            blueprint_id INTEGER,
+            ewma REAL,
+            ewm_var REAL,
+            p10 REAL,
+            p50 REAL,
+            p90 REAL,
+            samples INTEGER,
+            updated DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (game, blueprint_id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS deal_alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            game TEXT,
+            expansion TEXT,
+            blueprint_id INTEGER,
+            name TEXT,
+            rarity TEXT,
+            listing_id INTEGER,
+            price REAL,
+            floor REAL,
+            discount REAL,
+            savings REAL,
+            currency TEXT,
+            seller TEXT,
+            link TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT,
+            expires REAL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cell_access (
+            cell TEXT PRIMARY KEY,
+            hits INTEGER,
+            last_access DATETIME
+        )
+    ''')
+    # Cells with no catalog cards, so the scheduler stops re-planning them until the catalog changes
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS empty_cells (
+            game TEXT,
+            cell TEXT,
+            inventory_hash TEXT,
+            catalog TEXT,
+            checked DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (game, cell, inventory_hash)
+        )
+    ''')
 
     conn.commit()
     conn.close()
 
-def save_price(game, rarity, domain, quantity, zero_only, language, expansion, price, items_found, total_cards, currency, foil=False, items=None):
+@_timed("save_price")
+def save_price(game, rarity, domain, quantity, zero_only, language, expansion, price, items_found, total_cards, currency, foil=False, items=None, inventory_hash=None, sweep_id=None, sweep_cell=None, fingerprint=None):
+    """
+    Appends a price row and returns "saved".
+    With a fingerprint that matches the latest row for the cell, nothing was repriced:
+    that row's timestamp is bumped instead and "unchanged" is returned.
+    Rows written by a sweep are keyed by (sweep_id, sweep_cell), so repeating the write
+    is a no-op that returns None.
+    """
+    return _save_rows([dict(
+        game=game, rarity=rarity, domain=domain, quantity=quantity, zero_only=zero_only,
+        language=language, expansion=expansion, price=price, items_found=items_found,
+        total_cards=total_cards, currency=currency, foil=foil, items=items,
+        inventory_hash=inventory_hash, sweep_id=sweep_id, sweep_cell=sweep_cell, fingerprint=fingerprint
+    )])[0]
+
+@_timed("save_prices")
+def save_prices(rows):
+    """
+    Bulk save_price in a single transaction. `rows` are dicts of save_price's arguments;
+    returns one status per row.
+    """
+    return _save_rows(rows)
+
+def _save_rows(rows):
     conn = sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
-    items_json = json.dumps(items) if items else None
-    cursor.execute('''
-        INSERT INTO price_history 
-        (game, rarity, domain, quantity, zero_only, language, expansion, price, items_found, total_cards, currency, foil, items_json)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (game, rarity, domain, quantity, zero_only, language, expansion, price, items_found, total_cards, currency, foil, items_json))
+    statuses = []
+    for row in rows:
+        game, rarity, domain = row['game'], row['rarity'], row['domain']
+        quantity, zero_only, language, expansion = row['quantity'], row['zero_only'], row.get('language'), row.get('expansion')
+        foil, inventory_hash = row.get('foil', False), row.get('inventory_hash')
+        fingerprint = row.get('fingerprint')
+
+        if fingerprint:
+            lang_filter = "language IS ?" if language else "language IS NULL"
+            exp_filter = "expansion IS ?" if expansion else "expansion IS NULL"
+            inv_filter = "inventory_hash IS ?" if inventory_hash else "inventory_hash IS NULL"
+            params = [game, rarity, domain, quantity, zero_only, foil]
+            if language: params.append(language)
+            if expansion: params.append(expansion)
+            if inventory_hash: params.append(inventory_hash)
+            latest = cursor.execute(f'''
+                SELECT id, fingerprint FROM price_history
+                WHERE game = ? AND rarity = ? AND domain = ? AND quantity = ? AND zero_only = ? AND foil = ?
+                AND {lang_filter} AND {exp_filter} AND {inv_filter}
+                ORDER BY timestamp DESC LIMIT 1
+            ''', params).fetchone()
+            if latest and latest[1] == fingerprint:
+                cursor.execute("UPDATE price_history SET timestamp = CURRENT_TIMESTAMP WHERE id = ?", (latest[0],))
+                statuses.append("unchanged")
+                continue
+
+        items = row.get('items')
+        cursor.execute('''
+            INSERT OR IGNORE INTO price_history
+            (game, rarity, domain, quantity, zero_only, language, expansion, price, items_found, total_cards, currency, foil, items_json, inventory_hash, sweep_id, sweep_cell, fingerprint)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (game, rarity, domain, quantity, zero_only, language, expansion, row['price'], row['items_found'], row['total_cards'],
+              row['currency'], foil, json.dumps(items) if items else None, inventory_hash, row.get('sweep_id'), row.get('sweep_cell'), fingerprint))
+        statuses.append("saved" if cursor.rowcount > 0 else None)
+    conn.commit()
+    conn.close()
+
+    for row, status in zip(rows, statuses):
+        if status:
+            for callback in _write_listeners:
+                callback(row['game'], row['rarity'], row['domain'], row['quantity'], row['zero_only'], row.get('language'),
+                         row.get('expansion'), row.get('foil', False), row.get('inventory_hash'))
+    return statuses
+
+def create_sweep(game, params):
+    """Starts a new sweep record and returns its id."""
+    sweep_id = uuid.uuid4().hex
+    conn = sqlite3.connect(DB_NAME)
+    conn.execute(
+        "INSERT INTO sweeps (id, game, params_json, status) VALUES (?, ?, ?, 'running')",
+        (sweep_id, game, json.dumps(params, sort_keys=True))
+    )
+    conn.commit()
+    conn.close()
+    return sweep_id
+
+def get_sweep(sweep_id):
+    conn = sqlite3.connect(DB_NAME)
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT * FROM sweeps WHERE id = ?", (sweep_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def find_unfinished_sweep(game, params):
+    """Most recent sweep with the same game and parameters that never finished, if any."""
+    conn = sqlite3.connect(DB_NAME)
+    conn.row_factory = sqlite3.Row
+    row = conn.execute('''
+        SELECT * FROM sweeps WHERE game = ? AND params_json = ? AND status = 'running'
+        ORDER BY created DESC, rowid DESC LIMIT 1
+    ''', (game, json.dumps(params, sort_keys=True))).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def get_completed_cells(sweep_id):
+    """
+    Cells the sweep already handled: checkpointed ones, plus any whose price row was
+    written just before a crash cut off the checkpoint.
+    """
+    conn = sqlite3.connect(DB_NAME)
+    rows = conn.execute('''
+        SELECT cell FROM sweep_cells WHERE sweep_id = ?
+        UNION SELECT sweep_cell FROM price_history WHERE sweep_id = ?
+    ''', (sweep_id, sweep_id)).fetchall()
+    conn.close()
+    return {row[0] for row in rows}
+
+def checkpoint_cells(sweep_id, cells):
+    """Records that sweep cells were handled: [(cell, status)] with 'saved', 'unchanged' or 'skipped'."""
+    conn = sqlite3.connect(DB_NAME)
+    conn.executemany(
+        "INSERT OR REPLACE INTO sweep_cells (sweep_id, cell, status) VALUES (?, ?, ?)",
+        [(sweep_id, cell, status) for cell, status in cells]
+    )
+    conn.commit()
+    conn.close()
+
+def finish_sweep(sweep_id):
+    conn = sqlite3.connect(DB_NAME)
+    conn.execute("UPDATE sweeps SET status = 'done', finished = CURRENT_TIMESTAMP WHERE id = ?", (sweep_id,))
     conn.commit()
     conn.close()
 
-def get_latest_price(game, rarity, domain, quantity, zero_only, language, expansion, foil=False):
+def get_age_seconds(row):
+    """Seconds since a price_history row was written (timestamps are stored in UTC)."""
+    written = datetime.strptime(row['timestamp'], "%Y-%m-%d %H:%M:%S")
+    return max(0, (datetime.utcnow() - written).total_seconds())
+
+@_timed("get_latest_price")
+def get_latest_price(game, rarity, domain, quantity, zero_only, language, expansion, foil=False, inventory_hash=None):
     conn = sqlite3.connect(DB_NAME)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
     lang_filter = "language IS ?" if language else "language IS NULL"
     exp_filter = "expansion IS ?" if expansion else "expansion IS NULL"
+    inv_filter = "inventory_hash IS ?" if inventory_hash else "inventory_hash IS NULL"
     
     query = f'''
         SELECT * FROM price_history 
         WHERE game = ? AND rarity = ? AND domain = ? AND quantity = ? AND zero_only = ? AND foil = ?
-        AND {lang_filter} AND {exp_filter}
+        AND {lang_filter} AND {exp_filter} AND {inv_filter}
         ORDER BY timestamp DESC LIMIT 1
     '''
     
     params = [game, rarity, domain, quantity, zero_only, foil]
     if language: params.append(language)
     if expansion: params.append(expansion)
+    if inventory_hash: params.append(inventory_hash)
     
     cursor.execute(query, params)
     row = cursor.fetchone()
@@ -81,13 +325,43 @@ def get_latest_price(game, rarity, domain, quantity, zero_only, language, expans
         return d
     return None
 
-def get_all_latest(game, quantity, zero_only, language, expansion, foil=False):
+@_timed("get_latest_version")
+def get_latest_version(game, quantity, zero_only, language, expansion, foil=False, inventory_hash=None):
+    """
+    Cheap version marker for the rows behind get_all_latest.
+    Changes whenever a matching row is inserted or its timestamp moves.
+    """
+    conn = sqlite3.connect(DB_NAME)
+    cursor = conn.cursor()
+
+    lang_filter = "language IS ?" if language else "language IS NULL"
+    exp_filter = "expansion IS ?" if expansion else "expansion IS NULL"
+    inv_filter = "inventory_hash IS ?" if inventory_hash else "inventory_hash IS NULL"
+
+    query = f'''
+        SELECT MAX(id), MAX(timestamp), COUNT(*) FROM price_history
+        WHERE game = ? AND quantity = ? AND zero_only = ? AND foil = ? AND {lang_filter} AND {exp_filter} AND {inv_filter}
+    '''
+
+    params = [game, quantity, zero_only, foil]
+    if language: params.append(language)
+    if expansion: params.append(expansion)
+    if inventory_hash: params.append(inventory_hash)
+
+    cursor.execute(query, params)
+    row = cursor.fetchone()
+    conn.close()
+    return "-".join(str(v) for v in row)
+
+@_timed("get_all_latest")
+def get_all_latest(game, quantity, zero_only, language, expansion, foil=False, inventory_hash=None):
     conn = sqlite3.connect(DB_NAME)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
     lang_filter = "language IS ?" if language else "language IS NULL"
     exp_filter = "expansion IS ?" if expansion else "expansion IS NULL"
+    inv_filter = "inventory_hash IS ?" if inventory_hash else "inventory_hash IS NULL"
     
     query = f'''
         SELECT rarity, domain, price, items_found, total_cards, currency, timestamp, foil, items_json
@@ -96,14 +370,15 @@ def get_all_latest(game, quantity, zero_only, language, expansion, foil=False):
             SELECT MAX(timestamp) 
             FROM price_history p2 
             WHERE p1.game = p2.game AND p1.rarity = p2.rarity AND p1.domain = p2.domain
-            AND quantity = ? AND zero_only = ? AND foil = ? AND {lang_filter} AND {exp_filter}
+            AND quantity = ? AND zero_only = ? AND foil = ? AND {lang_filter} AND {exp_filter} AND {inv_filter}
         )
-        AND quantity = ? AND zero_only = ? AND foil = ? AND {lang_filter} AND {exp_filter}
+        AND quantity = ? AND zero_only = ? AND foil = ? AND {lang_filter} AND {exp_filter} AND {inv_filter}
     '''
     
     p = [quantity, zero_only, foil]
     if language: p.append(language)
     if expansion: p.append(expansion)
+    if inventory_hash: p.append(inventory_hash)
     params = [game] + p + p 
     
     cursor.execute(query, params)
@@ -115,4 +390,141 @@ def get_all_latest(game, quantity, zero_only, language, expansion, foil=False):
         if d.get('items_json'):
             d['items'] = json.loads(d['items_json'])
         results.append(d)
-    return results
\ No newline at end of file
+    return results
+
+_STATS_FIELDS = ("ewma", "ewm_var", "p10", "p50", "p90", "samples")
+
+def get_listing_stats(game, blueprint_ids):
+    """{blueprint_id: running price statistics} for the blueprints that have any."""
+    conn = sqlite3.connect(DB_NAME)
+    conn.row_factory = sqlite3.Row
+    stats = {}
+    ids = list(blueprint_ids)
+    # Chunked to stay under SQLite's bound-parameter limit
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        rows = conn.execute(
+            f"SELECT * FROM listing_stats WHERE game = ? AND blueprint_id IN ({','.join('?' * len(chunk))})",
+            [game] + chunk
+        ).fetchall()
+        for row in rows:
+            stats[row['blueprint_id']] = {field: row[field] for field in _STATS_FIELDS}
+    conn.close()
+    return stats
+
+def save_listing_stats(game, stats):
+    """Upserts {blueprint_id: statistics} in one transaction."""
+    conn = sqlite3.connect(DB_NAME)
+    conn.executemany(f'''
+        INSERT OR REPLACE INTO listing_stats (game, blueprint_id, {", ".join(_STATS_FIELDS)}, updated)
+        VALUES (?, ?, {", ".join("?" * len(_STATS_FIELDS))}, CURRENT_TIMESTAMP)
+    ''', [(game, bp_id) + tuple(s[field] for field in _STATS_FIELDS) for bp_id, s in stats.items()])
+    conn.commit()
+    conn.close()
+
+def save_deal_alert(deal):
+    """Stores a deal found by the watcher (a dict as built by app.core.deals)."""
+    conn = sqlite3.connect(DB_NAME)
+    conn.execute('''
+        INSERT INTO deal_alerts
+        (game, expansion, blueprint_id, name, rarity, listing_id, price, floor, discount, savings, currency, seller, link)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (deal['game'], deal['expansion'], deal['blueprint_id'], deal['name'], deal['rarity'], deal['listing_id'],
+          deal['price'], deal['floor'], deal['discount'], deal['savings'], deal['currency'], deal['seller'], deal['link']))
+    conn.commit()
+    conn.close()
+
+def acquire_lease(name, owner, ttl):
+    """
+    Takes or renews the named lease for `ttl` seconds. Succeeds when the lease is free,
+    expired or already held by `owner`, so one process at a time can run a singleton task.
+    """
+    now = time.time()
+    conn = sqlite3.connect(DB_NAME, timeout=10)
+    conn.execute('''
+        INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires
+        WHERE leases.owner = excluded.owner OR leases.expires < ?
+    ''', (name, owner, now + ttl, now))
+    conn.commit()
+    row = conn.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()
+    conn.close()
+    return row is not None and row[0] == owner
+
+def release_lease(name, owner):
+    conn = sqlite3.connect(DB_NAME, timeout=10)
+    conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+    conn.commit()
+    conn.close()
+
+def add_access_counts(counts):
+    """Adds buffered dashboard reads: {cell key: hits}."""
+    if not counts:
+        return
+    conn = sqlite3.connect(DB_NAME)
+    conn.executemany('''
+        INSERT INTO cell_access (cell, hits, last_access) VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (cell) DO UPDATE SET hits = hits + excluded.hits, last_access = excluded.last_access
+    ''', list(counts.items()))
+    conn.commit()
+    conn.close()
+
+def get_access_counts():
+    """{cell key: (hits, last_access)} for every cell read through the dashboard."""
+    conn = sqlite3.connect(DB_NAME)
+    rows = conn.execute("SELECT cell, hits, last_access FROM cell_access").fetchall()
+    conn.close()
+    return {cell: (hits, last_access) for cell, hits, last_access in rows}
+
+@_timed("get_cell_timestamps")
+def get_cell_timestamps(game, inventory_hash=None):
+    """{(rarity, domain, quantity, zero_only, language, expansion, foil): latest timestamp} for a game."""
+    conn = sqlite3.connect(DB_NAME)
+    inv_filter = "inventory_hash IS ?" if inventory_hash else "inventory_hash IS NULL"
+    params = [game] + ([inventory_hash] if inventory_hash else [])
+    rows = conn.execute(f'''
+        SELECT rarity, domain, quantity, zero_only, language, expansion, foil, MAX(timestamp)
+        FROM price_history WHERE game = ? AND {inv_filter}
+        GROUP BY rarity, domain, quantity, zero_only, language, expansion, foil
+    ''', params).fetchall()
+    conn.close()
+    return {(r, d, q, bool(z), lang, exp, bool(f)): ts for r, d, q, z, lang, exp, f, ts in rows}
+
+def mark_empty_cells(game, cells, inventory_hash=None, catalog=None):
+    """Records cell tuples (as in get_cell_timestamps) that priced no cards under catalog fingerprint `catalog`."""
+    if not cells:
+        return
+    conn = sqlite3.connect(DB_NAME)
+    conn.executemany('''
+        INSERT OR REPLACE INTO empty_cells (game, cell, inventory_hash, catalog, checked)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ''', [(game, json.dumps(list(cell)), inventory_hash or '', catalog) for cell in cells])
+    conn.commit()
+    conn.close()
+
+def get_empty_cells(game, inventory_hash=None):
+    """{cell tuple: (catalog fingerprint, checked timestamp)} for cells last found empty."""
+    conn = sqlite3.connect(DB_NAME)
+    rows = conn.execute(
+        "SELECT cell, catalog, checked FROM empty_cells WHERE game = ? AND inventory_hash = ?",
+        (game, inventory_hash or '')
+    ).fetchall()
+    conn.close()
+    return {tuple(json.loads(cell)): (catalog, checked) for cell, catalog, checked in rows}
+
+@_timed("get_price_series")
+def get_price_series(game, since_days, inventory_hash=None):
+    """{cell tuple (as in get_cell_timestamps): [prices, oldest first]} over the last `since_days`."""
+    conn = sqlite3.connect(DB_NAME)
+    inv_filter = "inventory_hash IS ?" if inventory_hash else "inventory_hash IS NULL"
+    params = [game] + ([inventory_hash] if inventory_hash else []) + [f"-{int(since_days)} days"]
+    rows = conn.execute(f'''
+        SELECT rarity, domain, quantity, zero_only, language, expansion, foil, price
+        FROM price_history WHERE game = ? AND {inv_filter} AND timestamp >= datetime('now', ?)
+        ORDER BY timestamp, id
+    ''', params).fetchall()
+    conn.close()
+    series = {}
+    for r, d, q, z, lang, exp, f, price in rows:
+        series.setdefault((r, d, q, bool(z), lang, exp, bool(f)), []).append(price)
+    return series
@@ -0,0 +1,257 @@
+import csv
+import heapq
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from . import api
+from . import baseline
+from . import database as db
+
+# Expansions are fetched in parallel; each is a single marketplace call
+DEAL_SCAN_WORKERS = int(os.getenv('DEAL_SCAN_WORKERS', '4'))
+
+CSV_FIELDS = [
+    "game", "expansion", "blueprint_id", "name", "rarity", "price", "floor", "discount",
+    "savings", "currency", "listings", "basis", "z", "seller", "listing_id", "link"
+]
+
+def _judge(listing, others, stats, max_ratio, min_listings, depth, min_z):
+    """
+    Returns (floor, z, basis) when `listing` is a deal, else None.
+    With enough history the listing must be at most max_ratio of the blueprint's median
+    floor, min_z deviations under its average and below its 10th percentile; otherwise it
+    is compared with the `depth` cheapest `others` in the same snapshot.
+    """
+    price = listing['price_cents']
+    if stats and stats["samples"] >= baseline.BASELINE_MIN_SAMPLES:
+        scored = baseline.score(stats, price)
+        if scored["ratio"] <= max_ratio and scored["z"] >= min_z and scored["below_p10"]:
+            return stats["p50"], round(scored["z"], 2), "history"
+        return None
+
+    if len(others) + 1 < min_listings:
+        return None
+    pool = heapq.nsmallest(depth, others)
+    floor = sum(pool) / len(pool)
+    if floor and price <= floor * max_ratio:
+        return floor, None, "snapshot"
+    return None
+
+def scan_expansion(game, exp_name, exp_id, rarities=None, lang_target=None, zero_only=False,
+                   max_ratio=0.8, min_listings=4, depth=5, history=False, min_z=2.0):
+    """
+    Underpriced listings in one expansion: blueprints whose cheapest eligible copy is at
+    most `max_ratio` of the floor. Eligibility follows the dashboard rules (NM/M,
+    ungraded, non-foil preferred).
+    With `history`, each blueprint's running price statistics (listing_stats) are
+    updated from this snapshot and become the floor once they have enough samples.
+    """
+    rarities = {r.lower() for r in rarities} if rarities else None
+    blueprints = api.fetch_blueprints(exp_id, max_age=api.BLUEPRINT_CACHE_TTL)
+    products = api.fetch_expansion_products(exp_id)
+    known = db.get_listing_stats(game.name, [bp['id'] for bp in blueprints]) if history else {}
+    updated = {}
+
+    deals = []
+    for bp in blueprints:
+        rarity = game.blueprint_rarity(bp)
+        if rarities and rarity.lower() not in rarities:
+            continue
+        listings = game.filter_listings(products.get(str(bp['id']), []), zero_only, lang_target)
+        priced = [l for l in listings if l.get('price_cents') is not None]
+        if not priced:
+            continue
+
+        prices = [l['price_cents'] for l in priced]
+        stats = known.get(bp['id'])
+        if history:
+            # Scored against the history before this snapshot, so a dip can't hide itself
+            updated[bp['id']] = baseline.update(stats, baseline.market_floor(prices, depth))
+
+        best = min(priced, key=lambda l: l['price_cents'])
+        others = [l['price_cents'] for l in priced if l is not best]
+        verdict = _judge(best, others, stats, max_ratio, min_listings, depth, min_z)
+        if verdict:
+            deals.append(_deal(game, exp_name, bp, rarity, best, len(priced), *verdict))
+
+    if updated:
+        db.save_listing_stats(game.name, updated)
+    return deals
+
+def _deal(game, exp_name, bp, rarity, listing, listing_count, floor, z=None, basis="snapshot"):
+    price = listing['price_cents']
+    return {
+        "game": game.name,
+        "expansion": exp_name,
+        "blueprint_id": bp['id'],
+        "name": bp['name'],
+        "rarity": rarity,
+        "price": price / 100,
+        "floor": round(floor / 100, 2),
+        "discount": round(1 - price / floor, 4),
+        "savings": round((floor - price) / 100, 2),
+        "currency": listing.get('price_currency', 'EUR'),
+        "listings": listing_count,
+        "basis": basis,
+        "z": z,
+        "seller": listing.get('user', {}).get('username'),
+        "listing_id": listing.get('id'),
+        "link": f"https://www.cardtrader.com/cards/{bp['id']}"
+    }
+
+def scan(game, expansions, sort="discount", **filters):
+    """
+    Scans {name: id} expansions and ranks every deal by discount (then savings) or by
+    savings (then discount). Returns (deals, errors).
+    """
+    deals, errors = [], []
+    with ThreadPoolExecutor(max_workers=DEAL_SCAN_WORKERS) as pool:
+        futures = {
+            pool.submit(scan_expansion, game, exp_name, exp_id, **filters): exp_name
+            for exp_name, exp_id in expansions.items()
+        }
+        for future, exp_name in futures.items():
+            try:
+                deals.extend(future.result())
+            except Exception as e:
+                errors.append(f"{exp_name}: {e}")
+
+    keys = ("savings", "discount") if sort == "savings" else ("discount", "savings")
+    deals.sort(key=lambda d: (d[keys[0]], d[keys[1]]), reverse=True)
+    return deals, errors
+
+def write_json(deals, f):
+    json.dump(deals, f, indent=2)
+    f.write("\n")
+
+def write_csv(deals, f):
+    writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    writer.writerows(deals)
+
+class DealWatcher:
+    """
+    Polls expansions and alerts on listings that appear (or drop in price) below the floor.
+    The last snapshot of every blueprint is kept, so only blueprints whose listings changed
+    are re-evaluated, and only their new or cheaper listings can trigger an alert.
+    `sinks` are callables taking a deal dict (see stdout_sink, webhook_sink, db_sink).
+    """
+
+    def __init__(self, game, expansions, sinks, rarities=None, lang_target=None, zero_only=False,
+                 max_ratio=0.8, min_listings=4, depth=5, history=False, min_z=2.0):
+        self.game = game
+        self.expansions = expansions
+        self.sinks = sinks
+        self.rarities = {r.lower() for r in rarities} if rarities else None
+        self.lang_target = lang_target
+        self.zero_only = zero_only
+        self.max_ratio = max_ratio
+        self.min_listings = min_listings
+        self.depth = depth
+        self.history = history
+        self.min_z = min_z
+        self._snapshots = {}  # blueprint_id -> {listing id: (price_cents, quantity)}
+        self._blueprints = {}  # blueprint_id -> (exp_name, blueprint)
+        self._alerted = set()  # (listing id, price_cents) already reported
+        self.polls = 0
+
+    def poll(self):
+        """One pass over every expansion. Returns the deals alerted during it."""
+        found, listed = [], set()
+        for exp_name, exp_id in self.expansions.items():
+            for bp in api.fetch_blueprints(exp_id, max_age=api.BLUEPRINT_CACHE_TTL):
+                self._blueprints.setdefault(bp['id'], (exp_name, bp))
+            products = api.fetch_expansion_products(exp_id)
+            known = db.get_listing_stats(self.game.name, [int(bp_id) for bp_id in products]) if self.history else {}
+            updated = {}
+            for bp_id, listings in products.items():
+                listed.update(l.get('id') for l in listings)
+                found.extend(self._diff(int(bp_id), listings, known.get(int(bp_id)), updated))
+            if updated:
+                db.save_listing_stats(self.game.name, updated)
+        # Listings that are gone can't alert again, so a long watch only remembers live ones
+        self._alerted = {key for key in self._alerted if key[0] in listed}
+        self.polls += 1
+        for deal in found:
+            for sink in self.sinks:
+                sink(deal)
+        return found
+
+    def _diff(self, bp_id, listings, stats, updated):
+        """
+        Deals among the new or cheaper listings of one blueprint. With history, every changed
+        snapshot (the first one included) is folded into the blueprint's statistics via
+        `updated`, while judging uses `stats` from before it.
+        """
+        snapshot = {l.get('id'): (l.get('price_cents'), l.get('quantity')) for l in listings}
+        previous = self._snapshots.get(bp_id)
+        self._snapshots[bp_id] = snapshot
+        if snapshot == previous:
+            return []
+
+        priced = [
+            l for l in self.game.filter_listings(listings, self.zero_only, self.lang_target)
+            if l.get('price_cents') is not None
+        ]
+        if self.history and priced:
+            updated[bp_id] = baseline.update(stats, baseline.market_floor([l['price_cents'] for l in priced], self.depth))
+        # The first poll only records the baseline
+        if previous is None:
+            return []
+
+        # New listings, or existing ones whose price went down
+        changed = {
+            listing_id for listing_id, (price, _) in snapshot.items()
+            if listing_id not in previous or (price is not None and previous[listing_id][0] is not None and price < previous[listing_id][0])
+        }
+        if not changed or bp_id not in self._blueprints:
+            return []
+        exp_name, bp = self._blueprints[bp_id]
+        rarity = self.game.blueprint_rarity(bp)
+        if (self.rarities and rarity.lower() not in self.rarities) or not priced:
+            return []
+
+        deals = []
+        for listing in priced:
+            key = (listing.get('id'), listing['price_cents'])
+            if listing.get('id') not in changed or key in self._alerted:
+                continue
+            others = [l['price_cents'] for l in priced if l is not listing]
+            verdict = _judge(listing, others, stats, self.max_ratio, self.min_listings, self.depth, self.min_z)
+            if verdict:
+                self._alerted.add(key)
+                deals.append(_deal(self.game, exp_name, bp, rarity, listing, len(priced), *verdict))
+        return deals
+
+    def watch(self, interval=30, stop_event=None, max_polls=None, on_error=None):
+        """Polls every `interval` seconds until stop_event is set or max_polls is reached."""
+        while not (stop_event and stop_event.is_set()) and (max_polls is None or self.polls < max_polls):
+            began = time.time()
+            try:
+                self.poll()
+            except Exception as e:
+                if on_error:
+                    on_error(e)
+            remaining = interval - (time.time() - began)
+            if remaining > 0 and (max_polls is None or self.polls < max_polls):
+                if stop_event:
+                    stop_event.wait(remaining)
+                else:
+                    time.sleep(remaining)
+
+def stdout_sink(deal):
+    print(json.dumps(deal), flush=True)
+
+def webhook_sink(url, timeout=5):
+    """Sink that POSTs each deal as JSON to `url`; delivery failures are printed, not raised."""
+    def sink(deal):
+        try:
+            requests.post(url, json=deal, timeout=timeout)
+        except requests.RequestException as e:
+            print(f"Webhook delivery failed: {e}")
+    return sink
+
+def db_sink(deal):
+    db.save_deal_alert(deal)
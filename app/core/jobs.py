@@ -0,0 +1,126 @@
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from . import ratelimit
+
+MAX_WORKERS = int(os.getenv('REFRESH_WORKERS', '2'))
+# Finished jobs are kept around this long so clients can still poll them
+JOB_RETENTION = int(os.getenv('REFRESH_JOB_RETENTION', '3600'))
+
+_executor = None
+_lock = threading.Lock()
+_jobs = {}
+_active = {}  # dedupe key -> id of the pending/running job for it
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="refresh")
+        return _executor
+
+def _public(job):
+    return {k: v for k, v in job.items() if not k.startswith('_')}
+
+def _prune():
+    cutoff = time.time() - JOB_RETENTION
+    for job_id in [j for j, job in _jobs.items() if job['finished'] and job['finished'] < cutoff]:
+        del _jobs[job_id]
+
+def _outranks(a, b):
+    """Whether rate-limit priority class a goes before b."""
+    return ratelimit.PRIORITY_RESERVE.get(a, 0.0) < ratelimit.PRIORITY_RESERVE.get(b, 0.0)
+
+def submit(key, func, *args, priority="interactive", **kwargs):
+    """
+    Queues func(progress, *args, **kwargs) in the background; its API calls run under the
+    rate-limit class `priority`. If a job with the same key is already pending or running,
+    that job is returned instead, and its priority is raised when this caller's is higher,
+    so an urgent caller never waits behind a background duplicate.
+    """
+    with _lock:
+        _prune()
+        existing = _active.get(key)
+        if existing:
+            job = _jobs[existing]
+            if _outranks(priority, job['priority']):
+                job['priority'] = priority
+            return _public(job)
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "pending",
+            "done": 0,
+            "total": None,
+            "result": None,
+            "error": None,
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "priority": priority,
+            "_key": key,
+            "_event": threading.Event(),
+        }
+        _jobs[job['id']] = job
+        _active[key] = job['id']
+
+    # Run in the submitter's context so request-scoped instrumentation follows the work
+    _get_executor().submit(contextvars.copy_context().run, _run, job, func, args, kwargs)
+    return _public(job)
+
+def _run(job, func, args, kwargs):
+    def progress(done, total):
+        job['done'] = done
+        job['total'] = total
+
+    with _lock:
+        if job['status'] == "cancelled":
+            return
+        job['status'] = "running"
+    job['started'] = time.time()
+    try:
+        # Read per API call, so a priority raised by a later submit applies mid-run
+        with ratelimit.priority(lambda: job['priority']):
+            job['result'] = func(progress, *args, **kwargs)
+        job['status'] = "done"
+    except Exception as e:
+        job['error'] = str(e)
+        job['status'] = "error"
+    finally:
+        job['finished'] = time.time()
+        with _lock:
+            if _active.get(job['_key']) == job['id']:
+                del _active[job['_key']]
+        job['_event'].set()
+
+def get_job(job_id):
+    with _lock:
+        job = _jobs.get(job_id)
+        return _public(job) if job else None
+
+def wait(job_id, timeout=None):
+    """Blocks until the job finishes (or timeout) and returns its latest state."""
+    with _lock:
+        job = _jobs.get(job_id)
+    if not job:
+        return None
+    job['_event'].wait(timeout)
+    return _public(job)
+
+def shutdown():
+    """Stops the pool; jobs that never started are marked cancelled so pollers see a final state."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor:
+        executor.shutdown(wait=False, cancel_futures=True)
+    with _lock:
+        for job in _jobs.values():
+            if job['status'] == "pending":
+                job.update(status="cancelled", error="Server shutting down", finished=time.time())
+                if _active.get(job['_key']) == job['id']:
+                    del _active[job['_key']]
+                job['_event'].set()
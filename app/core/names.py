@@ -0,0 +1,91 @@
+import contextvars
+import difflib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from . import api
+
+# Blueprint exports are loaded in parallel when an index is (re)built
+NAME_INDEX_WORKERS = int(os.getenv('NAME_INDEX_WORKERS', '4'))
+# Minimum difflib similarity (0-1) for a fuzzy name match
+NAME_FUZZY_CUTOFF = float(os.getenv('NAME_FUZZY_CUTOFF', '0.85'))
+
+_lock = threading.Lock()
+_indexes = {}  # game name -> (blueprint exports, index)
+
+def _load_exports(game):
+    """[(exp_name, exp_id, blueprints)] for every distinct expansion ID of the game; a failed export is empty."""
+    unique = {}
+    for exp_name, exp_id in game.expansions.items():
+        unique.setdefault(exp_id, exp_name)
+
+    def load(exp_id):
+        try:
+            return api.fetch_blueprints(exp_id, max_age=api.BLUEPRINT_CACHE_TTL)
+        except Exception:
+            return []
+
+    with ThreadPoolExecutor(max_workers=NAME_INDEX_WORKERS) as pool:
+        # Each load runs in a copy of the caller's context (priority class, call counting)
+        futures = [pool.submit(contextvars.copy_context().run, load, exp_id) for exp_id in unique]
+        exports = [future.result() for future in futures]
+    return [(exp_name, exp_id, blueprints) for (exp_id, exp_name), blueprints in zip(unique.items(), exports)]
+
+def get_index(game):
+    """
+    Normalized card name -> [(expansion name, blueprint)] across every expansion of `game`,
+    in the game's expansion order with base (unversioned) printings first.
+    Built from the cached blueprint exports and rebuilt only when one of them changes.
+    """
+    exports = _load_exports(game)
+    with _lock:
+        cached = _indexes.get(game.name)
+        if cached and len(cached[0]) == len(exports) and all(a is b for a, (_, _, b) in zip(cached[0], exports)):
+            return cached[1]
+
+    index = {}
+    for exp_name, exp_id, blueprints in exports:
+        for bp in sorted(blueprints, key=lambda bp: bp.get('version') not in (None, '')):
+            # Indexed under the full blueprint name and the name lists use for it
+            for key in {game.normalize_name(bp['name']), game.normalize_name(game.display_name(bp['name']))}:
+                index.setdefault(key, []).append((exp_name, bp))
+
+    with _lock:
+        _indexes[game.name] = ([blueprints for _, _, blueprints in exports], index)
+    return index
+
+def lookup(game, name, expansion_ids=None, index=None):
+    """
+    (expansion name, blueprint) for a card name or slug ("jinx-loose-cannon"), or None.
+    With expansion_ids only printings from those expansions match. Pass `index` (from
+    get_index) when resolving many names in a row.
+    """
+    index = get_index(game) if index is None else index
+    for exp_name, bp in index.get(game.normalize_name(name), []):
+        if expansion_ids is None or bp.get('expansion_id', game.expansions.get(exp_name)) in expansion_ids:
+            return exp_name, bp
+    return None
+
+def match(game, name, expansion_ids=None, index=None, fuzzy=True):
+    """
+    Like lookup, falling back to the closest indexed name (difflib, NAME_FUZZY_CUTOFF) for
+    typos and partial names. Returns (expansion name, blueprint, score) with score 1.0 for
+    an exact match, or None.
+    """
+    index = get_index(game) if index is None else index
+    found = lookup(game, name, expansion_ids, index)
+    if found:
+        return found + (1.0,)
+    if not fuzzy:
+        return None
+
+    wanted = game.normalize_name(name)
+    keys = index if expansion_ids is None else [
+        key for key, printings in index.items()
+        if any(bp.get('expansion_id', game.expansions.get(exp_name)) in expansion_ids for exp_name, bp in printings)
+    ]
+    for key in difflib.get_close_matches(wanted, keys, n=1, cutoff=NAME_FUZZY_CUTOFF):
+        found = lookup(game, key, expansion_ids, index)
+        if found:
+            return found + (round(difflib.SequenceMatcher(None, wanted, key).ratio(), 3),)
+    return None
@@ -0,0 +1,88 @@
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from . import api
+from . import ratelimit
+
+# Kept small on purpose: prefetching is speculative and must not starve real requests
+PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', '2'))
+MAX_ACTIVE_PREFETCHES = int(os.getenv('MAX_ACTIVE_PREFETCHES', '8'))
+
+_executor = None
+_lock = threading.Lock()
+_prefetches = {}  # id -> state, insertion ordered so the oldest is evicted first
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+        return _executor
+
+def _public(state):
+    return {k: v for k, v in state.items() if not k.startswith('_')}
+
+def _warm(state, blueprint_id, max_age):
+    if state['_cancel'].is_set():
+        return
+    try:
+        # A fresh snapshot is a cache hit, so already-warm blueprints cost nothing
+        with ratelimit.priority("background"):
+            api.fetch_marketplace_products(blueprint_id, max_age=max_age)
+    except Exception:
+        with _lock:
+            state['failed'] += 1
+    finally:
+        with _lock:
+            state['done'] += 1
+            if state['done'] >= state['total'] and state['status'] == "running":
+                state['status'] = "done"
+
+def start(blueprint_ids, max_age):
+    """Warms the listing cache for blueprint_ids in the background. Returns the prefetch state."""
+    state = {
+        "id": uuid.uuid4().hex,
+        "status": "running",
+        "done": 0,
+        "failed": 0,
+        "total": len(blueprint_ids),
+        "_cancel": threading.Event(),
+    }
+    with _lock:
+        _prefetches[state['id']] = state
+        while len(_prefetches) > MAX_ACTIVE_PREFETCHES:
+            oldest = next(iter(_prefetches))
+            _prefetches.pop(oldest)['_cancel'].set()
+
+    if not blueprint_ids:
+        state['status'] = "done"
+    executor = _get_executor()
+    for bp_id in blueprint_ids:
+        executor.submit(_warm, state, bp_id, max_age)
+    return _public(state)
+
+def cancel(prefetch_id):
+    with _lock:
+        state = _prefetches.pop(prefetch_id, None)
+    if not state:
+        return None
+    state['_cancel'].set()
+    if state['status'] == "running":
+        state['status'] = "cancelled"
+    return _public(state)
+
+def get_status(prefetch_id):
+    with _lock:
+        state = _prefetches.get(prefetch_id)
+        return _public(state) if state else None
+
+def shutdown():
+    global _executor
+    with _lock:
+        for state in _prefetches.values():
+            state['_cancel'].set()
+        _prefetches.clear()
+        executor, _executor = _executor, None
+    if executor:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,127 @@
+import contextvars
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import api
+from . import names
+
+PRICE_LIST_WORKERS = int(os.getenv('PRICE_LIST_WORKERS', '8'))
+# Expansions with at least this many listed blueprints are fetched with one marketplace call
+PRICE_LIST_EXPANSION_FETCH_MIN = int(os.getenv('PRICE_LIST_EXPANSION_FETCH_MIN', '5'))
+PRICE_LIST_LISTING_MAX_AGE = int(os.getenv('PRICE_LIST_LISTING_MAX_AGE', '900'))
+
+LINE_REGEX = re.compile(r'^\s*(\d+)\s*[xX]?\s+(.+?)\s*$')
+
+def parse(text):
+    """
+    (line number, quantity, name) for each card line of an 'Nx Card Name' list.
+    Blank lines and '#' comments are skipped; a line without a count means one copy.
+    """
+    entries = []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        m = LINE_REGEX.match(line)
+        if m:
+            entries.append((number, int(m.group(1)), m.group(2)))
+        else:
+            entries.append((number, 1, line))
+    return entries
+
+def fetch_listings(wanted, max_age=PRICE_LIST_LISTING_MAX_AGE, expansion_fetch_min=PRICE_LIST_EXPANSION_FETCH_MIN,
+                   workers=PRICE_LIST_WORKERS):
+    """
+    Listings for {blueprint_id: expansion_id}: ({blueprint_id: listings}, errors).
+    Expansions with at least expansion_fetch_min wanted blueprints take one expansion-wide
+    call, the rest are fetched per blueprint (cache-first); all of it runs concurrently,
+    each fetch in a copy of the caller's context (priority class, call counting).
+    """
+    by_exp = {}
+    for bp_id, exp_id in wanted.items():
+        by_exp.setdefault(exp_id, []).append(bp_id)
+
+    jobs = []
+    for exp_id, bp_ids in by_exp.items():
+        if exp_id and len(bp_ids) >= expansion_fetch_min:
+            jobs.append((exp_id, None, bp_ids))
+        else:
+            jobs.extend((None, bp_id, [bp_id]) for bp_id in bp_ids)
+
+    def fetch(job):
+        exp_id, bp_id, bp_ids = job
+        try:
+            if exp_id:
+                data = api.fetch_expansion_products(exp_id)
+            else:
+                data = api.fetch_marketplace_products(bp_id, max_age=max_age)
+        except Exception as e:
+            return {}, f"{'expansion ' + str(exp_id) if exp_id else 'blueprint ' + str(bp_id)}: {e}"
+        return {i: data.get(str(i), []) for i in bp_ids}, None
+
+    listings, errors = {}, []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, fetch, job) for job in jobs]
+        for found, error in (future.result() for future in futures):
+            listings.update(found)
+            if error:
+                errors.append(error)
+    return listings, errors
+
+def price_list(game, text, zero_only=False, lang_target=None, expansion_ids=None, fuzzy=True):
+    """
+    Prices a pasted 'Nx Card Name' list. Names resolve through the normalized name index
+    (fuzzy fallback optional), listings are fetched in one batch, and each card is filled
+    cheapest-first under the dashboard rules. Lines naming the same blueprint are priced
+    together. Returns totals plus a per-line breakdown.
+    """
+    begin = time.perf_counter()
+    with api.count_calls() as calls:
+        index = names.get_index(game)
+
+        lines, by_bp, wanted = [], {}, {}
+        for number, qty, name in parse(text):
+            line = {"line": number, "quantity": qty, "input": name, "match": None}
+            found = names.match(game, name, expansion_ids, index, fuzzy)
+            if found:
+                exp_name, bp, score = found
+                line.update(
+                    match="exact" if score == 1.0 else "fuzzy", score=score, name=bp['name'],
+                    expansion=exp_name, blueprint_id=bp['id'], link=f"https://www.cardtrader.com/cards/{bp['id']}"
+                )
+                by_bp.setdefault(bp['id'], []).append(line)
+                wanted[bp['id']] = bp.get('expansion_id', game.expansions.get(exp_name))
+            lines.append(line)
+
+        listings, errors = fetch_listings(wanted)
+
+    total_cents, currency = 0, None
+    for bp_id, bp_lines in by_bp.items():
+        needed = sum(l["quantity"] for l in bp_lines)
+        eligible = game.filter_listings(listings.get(bp_id, []), zero_only, lang_target)
+        cost, found, item_currency = game.fill_from_listings(eligible, needed)
+        prices = [l['price_cents'] for l in eligible if l.get('price_cents') is not None]
+        total_cents += cost
+        currency = item_currency or currency
+        # The combined fill is reported on the first line naming the card
+        for i, line in enumerate(bp_lines):
+            line.update(
+                best_price=min(prices) / 100 if prices else None,
+                found=found if i == 0 else 0,
+                missing=needed - found if i == 0 else 0,
+                cost=cost / 100 if i == 0 else 0.0
+            )
+
+    return {
+        "total": total_cents / 100,
+        "currency": currency or "EUR",
+        "cards": sum(l["quantity"] for l in lines),
+        "found": sum(l.get("found", 0) for l in lines),
+        "missing": sum(l.get("missing", 0) for l in lines),
+        "unmatched": [l["input"] for l in lines if not l["match"]],
+        "errors": errors,
+        "lines": lines,
+        "upstream_calls": calls.calls,
+        "seconds": round(time.perf_counter() - begin, 3)
+    }
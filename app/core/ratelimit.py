@@ -0,0 +1,119 @@
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# One token bucket for the API_CARDTRADER token, shared by the server, cron and CLI
+# scripts through a local SQLite file. API_RATE_PER_SEC=0 disables limiting.
+RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB', 'ratelimit.db')
+RATE_PER_SEC = float(os.getenv('API_RATE_PER_SEC', '10'))
+BURST = float(os.getenv('API_RATE_BURST', '20'))
+
+# Fraction of the bucket each class must leave untouched, so lower classes back off
+# before they can starve the ones above them
+PRIORITY_RESERVE = {
+    "interactive": 0.0,
+    "background": 0.25,
+    "cron": 0.5,
+}
+
+_priority = contextvars.ContextVar('api_priority', default=None)
+_process_priority = os.getenv('API_PRIORITY', 'interactive')
+_local = threading.local()
+
+def set_process_priority(name):
+    """Default priority for every call made by this process (e.g. 'cron' in cron_update.py)."""
+    global _process_priority
+    _process_priority = name
+
+def current_priority():
+    name = _priority.get()
+    return (name() if callable(name) else name) or _process_priority
+
+@contextmanager
+def priority(name):
+    """
+    Runs the enclosed API calls under a priority class. `name` may also be a callable
+    returning one, re-read before every call, for work whose priority can change.
+    """
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def _conn():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(RATE_LIMIT_DB, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS bucket (
+                name TEXT PRIMARY KEY,
+                tokens REAL,
+                updated REAL,
+                hold_until REAL
+            )
+        ''')
+        conn.execute(
+            "INSERT OR IGNORE INTO bucket (name, tokens, updated, hold_until) VALUES ('api', ?, ?, 0)",
+            (BURST, time.time())
+        )
+        _local.conn = conn
+    return conn
+
+def _try_take(priority_name):
+    """Takes one token if allowed. Returns 0 on success, otherwise seconds to wait."""
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        tokens, updated, hold_until = conn.execute(
+            "SELECT tokens, updated, hold_until FROM bucket WHERE name = 'api'"
+        ).fetchone()
+        now = time.time()
+        tokens = min(BURST, tokens + (now - updated) * RATE_PER_SEC)
+        reserve = PRIORITY_RESERVE.get(priority_name, 0.0) * BURST
+        # Interactive callers that had to wait put a hold on every lower class
+        held = priority_name != "interactive" and hold_until > now
+
+        if not held and tokens - 1 >= reserve:
+            wait = 0
+            tokens -= 1
+        else:
+            wait = max(0.01, (reserve + 1 - tokens) / RATE_PER_SEC)
+            if held:
+                wait = max(wait, hold_until - now)
+            if priority_name == "interactive":
+                hold_until = max(hold_until, now + wait)
+
+        conn.execute(
+            "UPDATE bucket SET tokens = ?, updated = ?, hold_until = ? WHERE name = 'api'",
+            (tokens, now, hold_until)
+        )
+        conn.execute("COMMIT")
+        return wait
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def acquire(priority_name=None):
+    """Blocks until this process may make one CardTrader API call."""
+    if RATE_PER_SEC <= 0:
+        return
+    while True:
+        wait = _try_take(priority_name or current_priority())
+        if not wait:
+            return
+        time.sleep(min(wait, 1.0))
+
+def penalize(retry_after):
+    """Empties the bucket after a 429 so every process backs off for retry_after seconds."""
+    if RATE_PER_SEC <= 0:
+        return
+    conn = _conn()
+    conn.execute(
+        "UPDATE bucket SET tokens = ?, updated = ? WHERE name = 'api'",
+        (-retry_after * RATE_PER_SEC, time.time())
+    )
@@ -0,0 +1,243 @@
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from . import api
+from . import database as db
+from . import metrics
+from . import ratelimit
+
+# Dashboard reads are counted in memory and written out at most this often
+ACCESS_FLUSH_INTERVAL = int(os.getenv('ACCESS_FLUSH_INTERVAL', '60'))
+# Price history window used to estimate how much a cell tends to move
+VOLATILITY_WINDOW_DAYS = int(os.getenv('VOLATILITY_WINDOW_DAYS', '30'))
+ACCESS_WEIGHT = float(os.getenv('SCHEDULER_ACCESS_WEIGHT', '1.0'))
+VOLATILITY_WEIGHT = float(os.getenv('SCHEDULER_VOLATILITY_WEIGHT', '4.0'))
+# Access counts lose half their weight after this many days without a read
+ACCESS_HALF_LIFE_DAYS = float(os.getenv('SCHEDULER_ACCESS_HALF_LIFE_DAYS', '7'))
+
+_access_lock = threading.Lock()
+_access_buffer = {}
+_last_flush = time.time()
+
+def _cell_key(game, rarity, domain, quantity, zero_only, language, expansion, foil):
+    return json.dumps([game, rarity, domain, int(quantity), bool(zero_only), language, expansion, bool(foil)])
+
+def record_access(game, rarity, domain, quantity, zero_only, language, expansion, foil):
+    """Counts a dashboard read of a cell; rarity and domain are '*' for a whole grid."""
+    global _last_flush
+    key = _cell_key(game, rarity, domain, quantity, zero_only, language, expansion, foil)
+    with _access_lock:
+        _access_buffer[key] = _access_buffer.get(key, 0) + 1
+        due = time.time() - _last_flush >= ACCESS_FLUSH_INTERVAL
+        if due:
+            _last_flush = time.time()
+    if due:
+        flush_access()
+
+def flush_access():
+    global _access_buffer
+    with _access_lock:
+        counts, _access_buffer = _access_buffer, {}
+    db.add_access_counts(counts)
+
+def _access_weights(game_name):
+    """Decayed read counts per cell tuple, with grid-level reads spread over every cell of the grid."""
+    cells, grids = {}, {}
+    now = datetime.utcnow()
+    for key, (hits, last_access) in db.get_access_counts().items():
+        game, rarity, domain, q, z, lang, exp, f = json.loads(key)
+        if game != game_name:
+            continue
+        idle_days = (now - datetime.strptime(last_access, "%Y-%m-%d %H:%M:%S")).total_seconds() / 86400
+        weight = hits * 0.5 ** (idle_days / ACCESS_HALF_LIFE_DAYS)
+        if rarity == "*":
+            grids[(q, z, lang, exp, f)] = weight
+        else:
+            cells[(rarity, domain, q, z, lang, exp, f)] = weight
+    return cells, grids
+
+def _volatility(prices):
+    """Mean relative change between consecutive prices; 0 for fewer than two points."""
+    changes = [abs(b - a) / a for a, b in zip(prices, prices[1:]) if a]
+    return sum(changes) / len(changes) if changes else 0.0
+
+def plan(games, variants, min_staleness=1.0):
+    """
+    Cells due for a refresh across `games` ({name: game}), highest priority first.
+    Candidates are every (rarity, domain, expansion) of each game for each variant
+    (quantity, zero_only, language, foil), plus every cell that has history or dashboard reads.
+    Priority = staleness (age / fresh_after) x access frequency x observed volatility;
+    cells younger than min_staleness x fresh_after are left alone, and so are cells last
+    found empty, until the game's catalog changes or expire_after passes.
+    Returns a list of (score, game_name, cell, inventory_hash).
+    """
+    now = datetime.utcnow()
+    queue = []
+    for game_name, game in games.items():
+        inventory_hash = game.collection_fingerprint()
+        timestamps = db.get_cell_timestamps(game_name, inventory_hash)
+        empty = db.get_empty_cells(game_name, inventory_hash)
+        catalog = game.catalog_fingerprint()
+        series = db.get_price_series(game_name, VOLATILITY_WINDOW_DAYS, inventory_hash)
+        cell_hits, grid_hits = _access_weights(game_name)
+
+        sweep_expansions = game.sweep_expansions
+        grids = set(grid_hits)
+        for q, z, lang, f in variants:
+            grids.update((q, bool(z), lang, exp, bool(f)) for exp in sweep_expansions)
+        candidates = set(timestamps) | set(cell_hits)
+        for q, z, lang, exp, f in grids:
+            for r in game.rarities:
+                for d in game.domains:
+                    candidates.add((r, d, q, z, lang, exp, f))
+
+        for cell in candidates:
+            rarity, domain, q, z, lang, exp, f = cell
+            if exp is None and None not in sweep_expansions:
+                continue
+            fresh_after, expire_after = game.freshness_policy(rarity, domain)
+            ts = timestamps.get(cell)
+            empty_catalog, checked = empty.get(cell, (None, None))
+            if checked and empty_catalog == catalog and (not ts or checked > ts):
+                if (now - datetime.strptime(checked, "%Y-%m-%d %H:%M:%S")).total_seconds() < expire_after:
+                    continue
+            if ts:
+                age = (now - datetime.strptime(ts, "%Y-%m-%d %H:%M:%S")).total_seconds()
+                staleness = age / fresh_after
+            else:
+                # Never priced: as urgent as an expired row
+                staleness = expire_after / fresh_after
+            if staleness < min_staleness:
+                continue
+            hits = cell_hits.get(cell, 0) + grid_hits.get((q, z, lang, exp, f), 0)
+            score = (
+                staleness
+                * (1 + ACCESS_WEIGHT * math.log1p(hits))
+                * (1 + VOLATILITY_WEIGHT * _volatility(series.get(cell, [])))
+            )
+            queue.append((score, game_name, cell, inventory_hash))
+
+    queue.sort(key=lambda item: item[0], reverse=True)
+    return queue
+
+def refresh_cell(game, game_name, cell, inventory_hash=None, listing_max_age=None):
+    """Reprices one cell and stores it. Returns "saved", "unchanged", "empty" or an error string."""
+    rarity, domain, q, z, lang, exp, f = cell
+    with metrics.pricing_latency.time(game=game_name, cell=f"{rarity}/{domain}"):
+        result = game.calculate_collection_cost(
+            rarity, domain, q, z, lang, exp, f, inventory_hash is not None,
+            listing_max_age=listing_max_age
+        )
+    if "error" in result:
+        return result["error"]
+    if result.get("count", 0) == 0:
+        return "empty"
+    return db.save_price(
+        game_name, rarity, domain, q, z, lang, exp,
+        result["total_cost"], result["items_found"], result["count"], result["currency"], f,
+        result.get("items"), inventory_hash, fingerprint=result.get("fingerprint")
+    ) or "saved"
+
+def run(games, variants, max_seconds=None, max_calls=None, listing_max_age=None, priority="cron", log=None, stop_event=None):
+    """
+    Refreshes planned cells in priority order until the queue is empty, a budget
+    (wall-clock seconds, CardTrader API calls) runs out or stop_event is set.
+    Returns a summary dict.
+    """
+    begin = time.time()
+    queue = plan(games, variants)
+    summary = {"planned": len(queue), "refreshed": 0, "saved": 0, "unchanged": 0, "empty": 0, "errors": 0, "stopped": None}
+    empty = {}  # (game_name, inventory_hash) -> cells that priced no cards
+
+    with api.count_calls() as calls, ratelimit.priority(priority):
+        for score, game_name, cell, inventory_hash in queue:
+            if stop_event is not None and stop_event.is_set():
+                summary["stopped"] = "shutdown"
+                break
+            if max_seconds is not None and time.time() - begin >= max_seconds:
+                summary["stopped"] = "time budget"
+                break
+            if max_calls is not None and calls.calls >= max_calls:
+                summary["stopped"] = "call budget"
+                break
+            try:
+                status = refresh_cell(games[game_name], game_name, cell, inventory_hash, listing_max_age)
+            except Exception as e:
+                status = str(e)
+            summary["refreshed"] += 1
+            if status in ("saved", "unchanged", "empty"):
+                summary[status] += 1
+                if status == "empty":
+                    empty.setdefault((game_name, inventory_hash), []).append(cell)
+            else:
+                summary["errors"] += 1
+            if log:
+                log(f"{game_name} {cell} score={score:.2f}: {status}")
+
+    for (game_name, inventory_hash), cells in empty.items():
+        db.mark_empty_cells(game_name, cells, inventory_hash, games[game_name].catalog_fingerprint())
+    summary["calls"] = calls.calls
+    summary["seconds"] = round(time.time() - begin, 1)
+    return summary
+
+# Optional in-server refresh loop (REFRESH_DAEMON=1). Every worker starts it, but a lease in
+# the prices database lets only one of them run cycles at a time.
+DAEMON_INTERVAL = int(os.getenv('REFRESH_DAEMON_INTERVAL', '900'))
+DAEMON_MAX_SECONDS = float(os.getenv('REFRESH_DAEMON_MAX_SECONDS', '300'))
+DAEMON_MAX_CALLS = int(os.getenv('REFRESH_DAEMON_MAX_CALLS', '0')) or None
+DAEMON_LISTING_MAX_AGE = int(os.getenv('REFRESH_DAEMON_LISTING_MAX_AGE', '900'))
+_DAEMON_LEASE = "refresh_daemon"
+
+_daemon = None  # (thread, stop event)
+_daemon_owner = uuid.uuid4().hex
+daemon_state = {"status": "off", "leader": False, "cycles": 0, "last_cycle": None, "last_summary": None, "last_error": None}
+
+def _daemon_loop(games, variants, stop):
+    # The lease outlives one cycle, so a worker that dies mid-cycle only blocks the others briefly
+    lease_ttl = DAEMON_MAX_SECONDS + DAEMON_INTERVAL
+    while not stop.is_set():
+        try:
+            daemon_state["leader"] = db.acquire_lease(_DAEMON_LEASE, _daemon_owner, lease_ttl)
+            if daemon_state["leader"]:
+                daemon_state["status"] = "running"
+                flush_access()
+                daemon_state["last_summary"] = run(
+                    games, variants, max_seconds=DAEMON_MAX_SECONDS, max_calls=DAEMON_MAX_CALLS,
+                    listing_max_age=DAEMON_LISTING_MAX_AGE, priority="background", stop_event=stop
+                )
+                daemon_state["cycles"] += 1
+                daemon_state["last_cycle"] = time.time()
+            daemon_state["last_error"] = None
+        except Exception as e:
+            daemon_state["last_error"] = str(e)
+        daemon_state["status"] = "idle"
+        stop.wait(DAEMON_INTERVAL)
+    daemon_state["status"] = "off"
+
+def start_daemon(games, variants=()):
+    """Starts the periodic refresh thread (no-op if it is already running)."""
+    global _daemon
+    if _daemon:
+        return
+    stop = threading.Event()
+    thread = threading.Thread(target=_daemon_loop, args=(games, list(variants), stop), name="refresh-daemon", daemon=True)
+    _daemon = (thread, stop)
+    daemon_state["status"] = "idle"
+    thread.start()
+
+def stop_daemon(timeout=10):
+    """Stops the refresh thread after the cell in progress and hands the lease back."""
+    global _daemon
+    if not _daemon:
+        return
+    thread, stop = _daemon
+    _daemon = None
+    stop.set()
+    thread.join(timeout)
+    if daemon_state["leader"]:
+        db.release_lease(_DAEMON_LEASE, _daemon_owner)
+        daemon_state["leader"] = False
@@ -0,0 +1,123 @@
+import threading
+import time
+from . import api
+
+# Inverted index over every listing snapshot this process has ingested (see
+# api.add_listing_listener): seller -> blueprint -> that seller's listings. A new snapshot
+# of a blueprint replaces only that blueprint's postings, and snapshots are dropped once
+# they are older than api.LISTING_CACHE_TTL, like the listing cache itself.
+_lock = threading.Lock()
+_by_seller = {}     # seller_id -> {blueprint_id: [listings]}
+_by_blueprint = {}  # blueprint_id -> (fetched_at, set of seller_ids), least recently ingested first
+_profiles = {}      # seller_id -> {"id", "username", "zero", "country"}
+
+def _seller_id(listing):
+    user = listing.get('user') or {}
+    return user.get('id', user.get('username'))
+
+def _drop(blueprint_id, seller_ids):
+    """Removes a blueprint's postings for seller_ids, and sellers left with none (caller holds _lock)."""
+    for seller_id in seller_ids:
+        postings = _by_seller.get(seller_id, {})
+        postings.pop(blueprint_id, None)
+        if not postings:
+            _by_seller.pop(seller_id, None)
+            _profiles.pop(seller_id, None)
+
+def _prune(cutoff):
+    """Drops the least recently ingested snapshots while they were fetched before cutoff (caller holds _lock)."""
+    while _by_blueprint:
+        blueprint_id, (fetched_at, seller_ids) = next(iter(_by_blueprint.items()))
+        if fetched_at >= cutoff:
+            break
+        del _by_blueprint[blueprint_id]
+        _drop(blueprint_id, seller_ids)
+
+def ingest(blueprint_id, listings, fetched_at):
+    """
+    Indexes one blueprint's listing snapshot. Snapshots older than the indexed one or than
+    api.LISTING_CACHE_TTL are ignored, and expired ones are pruned as new ones arrive.
+    """
+    cutoff = time.time() - api.LISTING_CACHE_TTL
+    if fetched_at < cutoff:
+        return
+    grouped, profiles = {}, {}
+    for l in listings:
+        seller_id = _seller_id(l)
+        if seller_id is None:
+            continue
+        grouped.setdefault(seller_id, []).append(l)
+        user = l['user']
+        profiles[seller_id] = {
+            "id": seller_id,
+            "username": user.get('username'),
+            "zero": bool(user.get('can_sell_via_hub')),
+            "country": user.get('country_code')
+        }
+
+    with _lock:
+        previous = _by_blueprint.get(blueprint_id)
+        if previous and previous[0] > fetched_at:
+            return
+        _drop(blueprint_id, (previous[1] if previous else set()) - grouped.keys())
+        for seller_id, seller_listings in grouped.items():
+            _by_seller.setdefault(seller_id, {})[blueprint_id] = seller_listings
+        _profiles.update(profiles)
+        # Re-inserted at the end so the oldest snapshots are always first in line for _prune
+        _by_blueprint.pop(blueprint_id, None)
+        _by_blueprint[blueprint_id] = (fetched_at, set(grouped))
+        _prune(cutoff)
+
+def missing(blueprint_ids, max_age=None):
+    """Blueprints with no indexed snapshot, or one older than max_age seconds."""
+    now = time.time()
+    with _lock:
+        return [
+            bp_id for bp_id in blueprint_ids
+            if bp_id not in _by_blueprint or (max_age is not None and now - _by_blueprint[bp_id][0] > max_age)
+        ]
+
+def rank(game, wanted, zero_only=False, lang_target=None, limit=20):
+    """
+    Sellers ranked by how much of `wanted` ({blueprint_id: quantity}) they cover, then by
+    the cost of covering it from them alone. Listings follow the dashboard rules and, with
+    zero_only, only CardTrader Zero sellers count. Only the requested blueprints' postings
+    are read, so a query costs the number of matching listings, not the catalog size.
+    """
+    with _lock:
+        candidates = {}
+        for bp_id in wanted:
+            for seller_id in _by_blueprint.get(bp_id, (0, ()))[1]:
+                candidates.setdefault(seller_id, []).append((bp_id, _by_seller[seller_id][bp_id]))
+        profiles = {seller_id: _profiles[seller_id] for seller_id in candidates}
+
+    ranked = []
+    for seller_id, postings in candidates.items():
+        profile = profiles[seller_id]
+        if zero_only and not profile["zero"]:
+            continue
+        items, cost_cents, copies, currency = [], 0, 0, None
+        for bp_id, listings in postings:
+            cost, found, item_currency = game.fill_from_listings(game.filter_listings(listings, False, lang_target), wanted[bp_id])
+            if not found:
+                continue
+            items.append({"blueprint_id": bp_id, "qty": found, "missing": wanted[bp_id] - found, "cost": cost / 100})
+            cost_cents += cost
+            copies += found
+            currency = item_currency or currency
+        if items:
+            ranked.append(dict(
+                profile, cards=len(items), copies=copies, cost=cost_cents / 100,
+                currency=currency or "EUR", items=items
+            ))
+
+    ranked.sort(key=lambda s: (-s["cards"], -s["copies"], s["cost"]))
+    return ranked[:limit] if limit else ranked
+
+def stats():
+    with _lock:
+        return {
+            "sellers": len(_by_seller),
+            "blueprints": len(_by_blueprint),
+            "postings": sum(len(p) for p in _by_seller.values())
+        }
@@ -0,0 +1,134 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Local SQLite file shared by every worker process on the box; empty disables it
+SHARED_CACHE_DB = os.getenv('SHARED_CACHE_DB', 'cache.db')
+# Generation counters are re-read from SQLite at most this often per key and process, so hot
+# reads stay in memory; another worker's invalidation shows up at most this late
+SHARED_GENERATION_CHECK_MS = int(os.getenv('SHARED_GENERATION_CHECK_MS', '500'))
+
+class SharedCache:
+    """
+    Cross-process key/value cache in a WAL-mode SQLite file.
+    Values are JSON. Every write is a single atomic statement. Per-key generation
+    counters let each process tell when its in-memory copy was invalidated elsewhere.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._generations = {}  # (namespace, key) -> (checked_at, generation)
+        conn = self._conn()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT,
+                key TEXT,
+                value TEXT,
+                stored_at REAL,
+                PRIMARY KEY (namespace, key)
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS generations (
+                namespace TEXT,
+                key TEXT,
+                generation INTEGER,
+                PRIMARY KEY (namespace, key)
+            )
+        ''')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(key):
+        return key if isinstance(key, str) else json.dumps(key)
+
+    def get(self, namespace, key, max_age=None):
+        """Returns (stored_at, value) or None if missing or older than max_age seconds."""
+        row = self._conn().execute(
+            "SELECT stored_at, value FROM entries WHERE namespace = ? AND key = ?",
+            (namespace, self._key(key))
+        ).fetchone()
+        if not row or (max_age is not None and time.time() - row[0] > max_age):
+            return None
+        return row[0], json.loads(row[1])
+
+    def set(self, namespace, key, value, stored_at=None):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO entries (namespace, key, value, stored_at) VALUES (?, ?, ?, ?)",
+            (namespace, self._key(key), json.dumps(value), stored_at or time.time())
+        )
+
+    def set_many(self, namespace, items, stored_at=None):
+        """Writes {key: value} in one transaction."""
+        stored_at = stored_at or time.time()
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, stored_at) VALUES (?, ?, ?, ?)",
+                [(namespace, self._key(key), json.dumps(value), stored_at) for key, value in items.items()]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def generation(self, namespace, key):
+        key = self._key(key)
+        now = time.time()
+        checked = self._generations.get((namespace, key))
+        if checked and now - checked[0] < SHARED_GENERATION_CHECK_MS / 1000:
+            return checked[1]
+        row = self._conn().execute(
+            "SELECT generation FROM generations WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        ).fetchone()
+        generation = row[0] if row else 0
+        self._generations[(namespace, key)] = (now, generation)
+        return generation
+
+    def invalidate(self, namespace, key):
+        """Drops the shared entry and bumps its generation so other processes drop theirs."""
+        conn = self._conn()
+        key = self._key(key)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            conn.execute('''
+                INSERT INTO generations (namespace, key, generation) VALUES (?, ?, 1)
+                ON CONFLICT (namespace, key) DO UPDATE SET generation = generation + 1
+            ''', (namespace, key))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        # This process sees its own invalidations immediately
+        self._generations.pop((namespace, key), None)
+
+    def purge(self, older_than):
+        """Deletes entries not written in the last `older_than` seconds."""
+        self._conn().execute("DELETE FROM entries WHERE stored_at < ?", (time.time() - older_than,))
+
+_shared = None
+_lock = threading.Lock()
+
+def get_shared_cache():
+    """Process-wide SharedCache, or None when SHARED_CACHE_DB is empty."""
+    global _shared
+    if not SHARED_CACHE_DB:
+        return None
+    with _lock:
+        if _shared is None:
+            _shared = SharedCache(SHARED_CACHE_DB)
+        return _shared
@@ -0,0 +1,84 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '2000'))
+SLOW_REQUEST_LOG = os.getenv('SLOW_REQUEST_LOG', 'slow_requests.log')
+
+# Phase totals for the request being served: name -> [seconds, count]
+_spans = contextvars.ContextVar('timing_spans', default=None)
+_lock = threading.Lock()
+_slow_logger = None
+
+def start():
+    """Begins collecting spans for the current request. Returns (spans, token for stop)."""
+    spans = {}
+    return spans, _spans.set(spans)
+
+def stop(token):
+    _spans.reset(token)
+
+def record(name, seconds):
+    spans = _spans.get()
+    if spans is None:
+        return
+    with _lock:
+        entry = spans.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+@contextmanager
+def span(name):
+    """Times a phase; a no-op outside an instrumented request."""
+    if _spans.get() is None:
+        yield
+        return
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - begin)
+
+def timed(name):
+    """Decorator form of span()."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def server_timing_header(spans, total):
+    parts = [f'{name};dur={seconds * 1000:.1f};desc="x{count}"' for name, (seconds, count) in spans.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+def _get_slow_logger():
+    global _slow_logger
+    if _slow_logger is None:
+        logger = logging.getLogger("cardtrader.slow_requests")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.addHandler(logging.FileHandler(SLOW_REQUEST_LOG))
+        _slow_logger = logger
+    return _slow_logger
+
+def log_if_slow(method, path, query, status, spans, total):
+    """Appends a JSON line with the full phase breakdown when a request exceeds SLOW_REQUEST_MS."""
+    if total * 1000 < SLOW_REQUEST_MS:
+        return
+    _get_slow_logger().info(json.dumps({
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "method": method,
+        "path": path,
+        "query": query,
+        "status": status,
+        "total_ms": round(total * 1000, 1),
+        "phases": {name: {"ms": round(seconds * 1000, 1), "count": count} for name, (seconds, count) in spans.items()}
+    }))
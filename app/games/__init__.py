@@ -0,0 +1,8 @@
+from .riftbound import RiftboundGame
+from .fab import FABGame
+
+# Supported games, keyed by the name used in URLs and the CLI
+GAMES = {
+    "riftbound": RiftboundGame(),
+    "fab": FABGame()
+}
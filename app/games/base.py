@@ -1,7 +1,19 @@
 from abc import ABC, abstractmethod
+import hashlib
+import os
 import re
+from ..core import api
+from ..core import timing
 
 class BaseGame(ABC):
+    # Freshness policy (seconds) for cached grid cells. Younger than FRESH_AFTER is served
+    # as-is, older than EXPIRE_AFTER blocks on a recompute, anything in between is served
+    # immediately and refreshed in the background.
+    FRESH_AFTER = int(os.getenv('PRICE_FRESH_AFTER', 6 * 3600))
+    EXPIRE_AFTER = int(os.getenv('PRICE_EXPIRE_AFTER', 7 * 24 * 3600))
+    # Per-cell overrides keyed by rarity or (rarity, domain): (fresh_after, expire_after)
+    FRESHNESS_OVERRIDES = {}
+
     @property
     @abstractmethod
     def name(self):
@@ -37,3 +49,151 @@ class BaseGame(ABC):
     def get_domain_property_name(self):
         """Property name in CardTrader for domain/color (e.g., 'riftbound_language' or 'mtg_rarity')."""
         pass
+
+    def freshness_policy(self, rarity, domain):
+        """Returns (fresh_after, expire_after) in seconds for a grid cell."""
+        policy = self.FRESHNESS_OVERRIDES.get((rarity, domain)) or self.FRESHNESS_OVERRIDES.get(rarity)
+        if policy:
+            return policy
+        prefix = self.name.upper()
+        return (
+            int(os.getenv(f'{prefix}_FRESH_AFTER', self.FRESH_AFTER)),
+            int(os.getenv(f'{prefix}_EXPIRE_AFTER', self.EXPIRE_AFTER))
+        )
+
+    @property
+    def sweep_expansions(self):
+        """Expansion filters a full refresh covers: None (every set at once) plus each expansion."""
+        names = {}
+        for exp_name, exp_id in self.expansions.items():
+            names.setdefault(exp_id, exp_name)
+        return [None] + list(names.values())
+
+    @property
+    def inventory_path(self):
+        return f"data/{self.name}/collection.csv"
+
+    def collection_fingerprint(self):
+        """Content hash of the collection file, or None when there is no inventory."""
+        try:
+            st = os.stat(self.inventory_path)
+        except OSError:
+            return None
+        # Only re-hash when the file actually changed on disk
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = getattr(self, '_fingerprint', None)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        with open(self.inventory_path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:16]
+        self._fingerprint = (stamp, digest)
+        return digest
+
+    @property
+    def catalog_path(self):
+        """Local card data file behind load_catalog, or None."""
+        return None
+
+    def catalog_fingerprint(self):
+        """Changes whenever the catalog file is modified; None when there is no catalog."""
+        try:
+            st = os.stat(self.catalog_path)
+        except (OSError, TypeError):
+            return None
+        return f"{st.st_mtime_ns}:{st.st_size}"
+
+    def load_catalog(self):
+        """Loads (and caches) the game's local card data."""
+        pass
+
+    def build_indexes(self, expansions):
+        """Builds lookup indexes over the cached blueprints of `expansions` (name -> id)."""
+        pass
+
+    def warm_up(self, expansions=None):
+        """
+        Preloads the catalog, blueprint exports and lookup indexes so the first requests are warm.
+        Returns a list of error strings; a failing expansion doesn't stop the others.
+        """
+        expansions = self.expansions if expansions is None else expansions
+        errors = []
+        self.load_catalog()
+
+        loaded = {}
+        for exp_name, exp_id in expansions.items():
+            try:
+                api.fetch_blueprints(exp_id, max_age=api.BLUEPRINT_CACHE_TTL)
+                loaded[exp_name] = exp_id
+            except Exception as e:
+                errors.append(f"{self.name}/{exp_name}: {e}")
+
+        self.build_indexes(loaded)
+        return errors
+
+    def display_name(self, blueprint_name):
+        """Card name as written in 'Nx Name' lists, without printing-specific decorations."""
+        return blueprint_name
+
+    def blueprint_rarity(self, blueprint):
+        """Rarity of a CardTrader blueprint, from its `<game>_rarity` fixed property."""
+        return blueprint.get('fixed_properties', {}).get(f'{self.name}_rarity', '')
+
+    def listing_language(self, listing):
+        """Lowercased language of a marketplace listing."""
+        return listing.get('properties_hash', {}).get('language', 'en').lower()
+
+    def filter_listings(self, listings, zero_only=False, lang_target=None, foil_target=False):
+        """
+        Dashboard pricing rules: ungraded NM/M copies, optionally Zero-only and one language.
+        Foil targets keep only foils; otherwise non-foils are preferred when any exist.
+        """
+        with timing.span("filter"):
+            if zero_only:
+                listings = [l for l in listings if l.get('user', {}).get('can_sell_via_hub')]
+
+            listings = [l for l in listings if not l.get('graded') and l.get('properties_hash', {}).get('condition') in ['Near Mint', 'Mint']]
+
+            if lang_target:
+                listings = [l for l in listings if self.listing_language(l) == lang_target.lower()]
+
+            if foil_target:
+                listings = [l for l in listings if self.is_foil(l)]
+            else:
+                non_foils = [l for l in listings if not self.is_foil(l)]
+                if non_foils: listings = non_foils
+        return listings
+
+    def pricing_fingerprint(self, card_count, inputs):
+        """
+        Stable hash of everything a cell's price depends on: the number of cards in the
+        cell and, per blueprint, the copies needed and the filtered listings considered.
+        `inputs` is a list of (blueprint_id, needed, listings).
+        """
+        digest = hashlib.sha256(str(card_count).encode())
+        for bp_id, needed, listings in sorted(inputs, key=lambda x: x[0]):
+            offers = sorted(
+                (str(l.get('id')), l.get('price_cents'), l.get('quantity', 1), l.get('price_currency'))
+                for l in listings
+            )
+            digest.update(repr((bp_id, needed, offers)).encode())
+        return digest.hexdigest()[:16]
+
+    def fill_from_listings(self, listings, needed):
+        """
+        Greedily takes the cheapest listings until `needed` copies are covered.
+        Returns (cost_cents, copies_found, currency) where currency is None if nothing was taken.
+        """
+        total_cents = 0
+        found = 0
+        currency = None
+        with timing.span("filter"):
+            for l in sorted(listings, key=lambda x: x.get('price_cents', float('inf'))):
+                if needed <= 0: break
+                price = l.get('price_cents')
+                if price is None: continue
+                to_take = min(l.get('quantity', 1), needed)
+                total_cents += to_take * price
+                needed -= to_take
+                found += to_take
+                currency = l.get('price_currency', currency)
+        return total_cents, found, currency
@@ -3,8 +3,16 @@ import os
 import re
 from .base import BaseGame
 from ..core import api
+from ..core import timing
+
+EXP_CODE_REGEX = re.compile(r'\s*\([^)]*[A-Z]{3,}[^)]*\)\s*')
+VARIANT_REGEX = re.compile(r'\s*-\s*(unlimited|1st edition|rainbow foil|cold foil|foil).*', re.I)
 
 class FABGame(BaseGame):
+    def __init__(self):
+        self._mapping = None  # (mtime, mapping, identities)
+        self._list_index = {}  # exp_name -> per-expansion list index
+
     @property
     def name(self):
         return "fab"
@@ -45,6 +53,11 @@ class FABGame(BaseGame):
             "Compendium of Rathe": 4375
         }
 
+    @property
+    def sweep_expansions(self):
+        # FAB cells are always priced within a single expansion
+        return super().sweep_expansions[1:]
+
     def is_foil(self, listing):
         props = listing.get('properties_hash', {})
         return props.get('foil') or props.get('fab_foil')
@@ -52,15 +65,23 @@ class FABGame(BaseGame):
     def get_domain_property_name(self):
         return None
 
+    @property
+    def catalog_path(self):
+        return "data/fab/fab-cards.csv"
+
     def load_cards_mapping(self):
-        """Loads FAB CSV and maps card names (+ color) to their Types."""
-        mapping = {}
-        path = "data/fab/fab-cards.csv"
+        """Loads FAB CSV and maps card names (+ color) to their Types. Cached until the CSV changes."""
+        path = self.catalog_path
         if not os.path.exists(path):
-            return mapping
-        
+            return {}
+
+        mtime = os.path.getmtime(path)
+        if self._mapping and self._mapping[0] == mtime:
+            return self._mapping[1]
+
+        mapping = {}
         try:
-            with open(path, mode='r', encoding='utf-8') as f:
+            with timing.span("csv_load"), open(path, mode='r', encoding='utf-8') as f:
                 reader = csv.DictReader(f)
                 for row in reader:
                     name = row.get('Name')
@@ -78,16 +99,147 @@ class FABGame(BaseGame):
                         mapping[norm_name_color] = types
         except Exception as e:
             print(f"Error loading FAB cards: {e}")
+
+        # Longest identity first so the most specific one wins prefix matching
+        identities = sorted(mapping.keys(), key=len, reverse=True)
+        self._mapping = (mtime, mapping, identities)
         return mapping
 
-    def calculate_collection_cost(self, rarity_target, domain_target, quantity=1, zero_only=False, lang_target=None, expansion_filter=None, foil_target=False, use_inventory=False):
+    def load_catalog(self):
+        return self.load_cards_mapping()
+
+    def display_name(self, blueprint_name):
+        """Drops set codes and printing variants ('Unlimited', 'Rainbow Foil', ...)."""
+        clean_name = EXP_CODE_REGEX.sub(' ', blueprint_name)
+        return VARIANT_REGEX.sub('', clean_name).strip()
+
+    def build_indexes(self, expansions):
+        for exp_name, exp_id in expansions.items():
+            self.get_expansion_index(exp_name, exp_id)
+
+    def match_expansions(self, expansion):
+        """Expansions matching a name exactly or partially; all of them for None/'all'."""
+        if not expansion or expansion.lower() == 'all':
+            return dict(self.expansions)
+        return {
+            exp_name: exp_id for exp_name, exp_id in self.expansions.items()
+            if expansion.lower() == exp_name.lower() or expansion.lower() in exp_name.lower()
+        }
+
+    def _build_expansion_index(self, exp_name, blueprints, type_mapping):
+        """Resolves every blueprint of an expansion to its card identity, grouped by (class, rarity)."""
+        identities = self._mapping[2]
+        full, dedup, by_rarity = {}, {}, {}
+
+        for bp in blueprints:
+            bp_rarity = bp.get('fixed_properties', {}).get('fab_rarity', '').lower()
+            bp_name = bp['name']
+            norm_bp_name = self.normalize_name(bp_name)
+
+            identity = None
+            for ident in identities:
+                if norm_bp_name.startswith(ident):
+                    identity = ident
+                    break
+            if not identity:
+                continue
+
+            clean_name = self.display_name(bp_name)
+            entry = {
+                "identity": identity,
+                "bp_id": bp['id'],
+                "name": bp_name,
+                "clean_name": clean_name,
+                "exp": exp_name,
+                "types": type_mapping.get(identity, "").lower()
+            }
+            by_rarity.setdefault(bp_rarity, []).append(entry)
+
+            for class_name in self.domains:
+                if class_name.lower() in entry["types"]:
+                    key = (class_name.lower(), bp_rarity)
+                    # Full keeps the last printing of a card, dedup keeps the first
+                    full.setdefault(key, {})[identity] = entry
+                    dedup.setdefault(key, {}).setdefault(identity, entry)
+
+        return {"full": full, "dedup": dedup, "by_rarity": by_rarity}
+
+    def get_expansion_index(self, exp_name, exp_id):
+        """
+        Per-expansion list index keyed by (class, rarity).
+        Rebuilt only when the cards CSV or the cached blueprint export changes.
+        """
+        type_mapping = self.load_cards_mapping()
+        blueprints = api.fetch_blueprints(exp_id, max_age=api.BLUEPRINT_CACHE_TTL)
+
+        cached = self._list_index.get(exp_name)
+        if cached and cached["blueprints"] is blueprints and cached["mapping"] is type_mapping:
+            return cached
+
+        index = self._build_expansion_index(exp_name, blueprints, type_mapping)
+        index.update(blueprints=blueprints, mapping=type_mapping)
+        self._list_index[exp_name] = index
+        return index
+
+    def list_cards(self, class_name, rarity, expansions, deduplicate=False):
+        """Cards of a class and rarity across expansions, keyed by identity."""
+        key = (class_name.lower(), rarity.lower())
+        variant = "dedup" if deduplicate else "full"
+        final_items = {}
+
+        for exp_name, exp_id in expansions.items():
+            try:
+                index = self.get_expansion_index(exp_name, exp_id)
+            except Exception:
+                continue
+
+            if any(key[0] == d.lower() for d in self.domains):
+                entries = index[variant].get(key, {})
+            else:
+                # Free-form class names aren't precomputed, filter the rarity bucket instead
+                entries = {}
+                for entry in index["by_rarity"].get(key[1], []):
+                    if key[0] in entry["types"]:
+                        if deduplicate:
+                            entries.setdefault(entry["identity"], entry)
+                        else:
+                            entries[entry["identity"]] = entry
+
+            for identity, entry in entries.items():
+                if deduplicate:
+                    final_items.setdefault(identity, entry)
+                else:
+                    final_items[identity] = entry
+        return final_items
+
+    def estimate_blueprint(self, bp_id, quantity=1, zero_only=False, listing_max_age=None):
+        """Cheapest non-foil NM/M fill for one blueprint: {id, price, qty, missing, currency}."""
+        market_data = api.fetch_marketplace_products(bp_id, max_age=listing_max_age)
+        listings = market_data.get(str(bp_id), [])
+
+        if zero_only:
+            listings = [l for l in listings if l.get('user', {}).get('can_sell_via_hub')]
+
+        listings = [l for l in listings if not l.get('graded') and l.get('properties_hash', {}).get('condition') in ['Near Mint', 'Mint']]
+        listings = [l for l in listings if not self.is_foil(l)]
+
+        cost_cents, found, currency = self.fill_from_listings(listings, quantity)
+        return {
+            "id": bp_id,
+            "price": cost_cents / 100,
+            "qty": found,
+            "missing": quantity - found,
+            "currency": currency or "EUR"
+        }
+
+    def calculate_collection_cost(self, rarity_target, domain_target, quantity=1, zero_only=False, lang_target=None, expansion_filter=None, foil_target=False, use_inventory=False, progress=None, listing_max_age=None):
         type_mapping = self.load_cards_mapping()
         exp_id = self.expansions.get(expansion_filter)
         if not exp_id:
             return {"error": f"Expansion '{expansion_filter}' not found for FAB"}
 
         try:
-            blueprints = api.fetch_blueprints(exp_id)
+            blueprints = api.fetch_blueprints(exp_id, max_age=api.BLUEPRINT_CACHE_TTL)
         except Exception as e:
             return {"error": f"Error fetching blueprints: {str(e)}"}
 
@@ -114,44 +266,21 @@ class FABGame(BaseGame):
         total_items_found = 0
         currency = "EUR"
         items_list = []
+        inputs = []
 
-        for bp in target_blueprints:
+        for i, bp in enumerate(target_blueprints):
+            if progress: progress(i, len(target_blueprints))
             try:
-                market_data = api.fetch_marketplace_products(bp['id'])
+                market_data = api.fetch_marketplace_products(bp['id'], max_age=listing_max_age)
                 listings = market_data.get(str(bp['id']), [])
             except: continue
 
-            if zero_only:
-                listings = [l for l in listings if l.get('user', {}).get('can_sell_via_hub')]
-
-            listings = [l for l in listings if not l.get('graded') and l.get('properties_hash', {}).get('condition') in ['Near Mint', 'Mint']]
-
-            if lang_target:
-                listings = [l for l in listings if l.get('properties_hash', {}).get('language', 'en').lower() == lang_target.lower()]
-
-            if foil_target:
-                listings = [l for l in listings if self.is_foil(l)]
-            else:
-                non_foils = [l for l in listings if not self.is_foil(l)]
-                if non_foils: listings = non_foils
-
+            listings = self.filter_listings(listings, zero_only, lang_target, foil_target)
+            inputs.append((bp['id'], quantity, listings))
             if not listings: continue
 
-            sorted_listings = sorted(listings, key=lambda x: x.get('price_cents', float('inf')))
-            needed = quantity
-            card_total = 0
-            card_found = 0
-            
-            for l in sorted_listings:
-                price = l.get('price_cents')
-                if price is None: continue
-                avail = l.get('quantity', 1)
-                to_take = min(avail, needed)
-                card_total += to_take * price
-                needed -= to_take
-                card_found += to_take
-                currency = l.get('price_currency', currency)
-                if needed <= 0: break
+            card_total, card_found, card_currency = self.fill_from_listings(listings, quantity)
+            currency = card_currency or currency
             
             if card_found > 0:
                 total_cost_cents += card_total
@@ -164,6 +293,8 @@ class FABGame(BaseGame):
                     "link": f"https://www.cardtrader.com/cards/{bp['id']}"
                 })
 
+        if progress: progress(len(target_blueprints), len(target_blueprints))
+
         return {
             "rarity": rarity_target,
             "domain": domain_target,
@@ -173,5 +304,6 @@ class FABGame(BaseGame):
             "total_cost": total_cost_cents / 100,
             "currency": currency,
             "using_inventory": False,
-            "items": items_list
+            "items": items_list,
+            "fingerprint": self.pricing_fingerprint(len(target_blueprints), inputs)
         }
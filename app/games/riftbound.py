@@ -3,8 +3,13 @@ import os
 import re
 from .base import BaseGame
 from ..core import api
+from ..core import timing
 
 class RiftboundGame(BaseGame):
+    def __init__(self):
+        self._cards = None  # (mtime, rows)
+        self._blueprint_index = {}  # exp_id -> (blueprints, {normalized name: blueprint})
+
     @property
     def name(self):
         return "riftbound"
@@ -34,6 +39,16 @@ class RiftboundGame(BaseGame):
             "Unleashed": 4425
         }
 
+    @property
+    def sweep_expansions(self):
+        """
+        None plus every expansion name the catalog's Set column uses. Cells are filtered on
+        that column, so an alias like "Spiritforged" (the catalog says "SFD") or a set with
+        no catalog cards would only sweep empty cells.
+        """
+        sets = {row['Set'].lower() for row in self.load_catalog()}
+        return [None] + [exp_name for exp_name in self.expansions if exp_name.lower() in sets]
+
     def normalize_name(self, name):
         return re.sub(r'[^a-z0-9]', '', name.lower())
 
@@ -41,6 +56,9 @@ class RiftboundGame(BaseGame):
         props = listing.get('properties_hash', {})
         return props.get('riftbound_foil') or props.get('foil')
 
+    def listing_language(self, listing):
+        return listing.get('properties_hash', {}).get('riftbound_language', '').lower()
+
     def get_domain_property_name(self):
         # Riftbound uses domain in the CSV but filters in marketplace might be different
         # Actually for Riftbound we filter the CSV items, not the API listings by domain property
@@ -48,12 +66,12 @@ class RiftboundGame(BaseGame):
 
     def load_inventory(self):
         inventory = {}
-        path = "data/riftbound/collection.csv"
+        path = self.inventory_path
         if not os.path.exists(path):
             return inventory
         
         try:
-            with open(path, mode='r', encoding='utf-8') as f:
+            with timing.span("csv_load"), open(path, mode='r', encoding='utf-8') as f:
                 reader = csv.DictReader(f)
                 for row in reader:
                     name = row.get('Name')
@@ -64,28 +82,66 @@ class RiftboundGame(BaseGame):
             print(f"Error loading inventory: {e}")
         return inventory
 
-    def calculate_collection_cost(self, rarity_target, domain_target, quantity=1, zero_only=False, lang_target=None, expansion_filter=None, foil_target=False, use_inventory=False):
+    @property
+    def catalog_path(self):
+        return "data/riftbound/cards.csv"
+
+    def load_catalog(self):
+        """Rows of data/riftbound/cards.csv, cached until the file changes."""
+        path = self.catalog_path
+        mtime = os.path.getmtime(path)
+        if self._cards and self._cards[0] == mtime:
+            return self._cards[1]
+
+        with timing.span("csv_load"), open(path, mode='r', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        self._cards = (mtime, rows)
+        return rows
+
+    def get_blueprint_index(self, exp_id):
+        """
+        Normalized card name -> blueprint for an expansion, preferring the base (unversioned)
+        printing. Rebuilt only when the cached blueprint export changes.
+        """
+        blueprints = api.fetch_blueprints(exp_id, max_age=api.BLUEPRINT_CACHE_TTL)
+        cached = self._blueprint_index.get(exp_id)
+        if cached and cached[0] is blueprints:
+            return cached[1]
+
+        index = {}
+        has_base = set()
+        for bp in blueprints:
+            norm_name = self.normalize_name(bp['name'])
+            if norm_name in has_base:
+                continue
+            index[norm_name] = bp
+            if bp.get('version') in [None, '']:
+                has_base.add(norm_name)
+        self._blueprint_index[exp_id] = (blueprints, index)
+        return index
+
+    def build_indexes(self, expansions):
+        for exp_id in set(expansions.values()):
+            self.get_blueprint_index(exp_id)
+
+    def calculate_collection_cost(self, rarity_target, domain_target, quantity=1, zero_only=False, lang_target=None, expansion_filter=None, foil_target=False, use_inventory=False, progress=None, listing_max_age=None):
         inventory = self.load_inventory() if use_inventory else None
         
         cards_to_buy = []
-        path = "data/riftbound/cards.csv"
         try:
-            with open(path, mode='r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['Rarity'].lower() != rarity_target.lower(): continue
-                    card_domains = [d.strip().lower() for d in row['Dominion'].split(',')]
-                    if domain_target.lower() not in card_domains: continue
-                    if expansion_filter and row['Set'].lower() != expansion_filter.lower(): continue
-                    
-                    target_qty = quantity
-                    if inventory:
-                        owned_qty = inventory.get(self.normalize_name(row['Name']), 0)
-                        target_qty = max(0, quantity - owned_qty)
-                    
-                    if target_qty > 0:
-                        row['_needed_qty'] = target_qty
-                        cards_to_buy.append(row)
+            for row in self.load_catalog():
+                if row['Rarity'].lower() != rarity_target.lower(): continue
+                card_domains = [d.strip().lower() for d in row['Dominion'].split(',')]
+                if domain_target.lower() not in card_domains: continue
+                if expansion_filter and row['Set'].lower() != expansion_filter.lower(): continue
+                
+                target_qty = quantity
+                if inventory:
+                    owned_qty = inventory.get(self.normalize_name(row['Name']), 0)
+                    target_qty = max(0, quantity - owned_qty)
+                
+                if target_qty > 0:
+                    cards_to_buy.append(dict(row, _needed_qty=target_qty))
         except Exception as e:
             return {"error": f"Error reading cards.csv: {str(e)}"}
 
@@ -96,67 +152,37 @@ class RiftboundGame(BaseGame):
         found_count = 0
         total_items_found = 0
         currency = "EUR"
-        blueprint_cache = {}
+        bp_indexes = {}
         items_list = [] # List of {name, qty, price, link}
+        inputs = []
 
-        for card in cards_to_buy:
+        for i, card in enumerate(cards_to_buy):
+            if progress: progress(i, len(cards_to_buy))
             card_name = card['Name']
             norm_name = self.normalize_name(card_name)
             set_name = card['Set']
             exp_id = self.expansions.get(set_name)
             if not exp_id: continue
 
-            if exp_id not in blueprint_cache:
+            if exp_id not in bp_indexes:
                 try:
-                    blueprint_cache[exp_id] = api.fetch_blueprints(exp_id)
+                    bp_indexes[exp_id] = self.get_blueprint_index(exp_id)
                 except: continue
 
-            target_bp = None
-            for bp in blueprint_cache.get(exp_id, []):
-                if self.normalize_name(bp['name']) == norm_name:
-                    if bp.get('version') in [None, '']:
-                        target_bp = bp
-                        break
-                    target_bp = bp
-            
+            target_bp = bp_indexes[exp_id].get(norm_name)
             if not target_bp: continue
 
             try:
-                market_data = api.fetch_marketplace_products(target_bp['id'])
+                market_data = api.fetch_marketplace_products(target_bp['id'], max_age=listing_max_age)
                 listings = market_data.get(str(target_bp['id']), [])
             except: continue
 
-            if zero_only:
-                listings = [l for l in listings if l.get('user', {}).get('can_sell_via_hub')]
-
-            listings = [l for l in listings if not l.get('graded') and l.get('properties_hash', {}).get('condition') in ['Near Mint', 'Mint']]
-
-            if lang_target:
-                listings = [l for l in listings if l.get('properties_hash', {}).get('riftbound_language', '').lower() == lang_target.lower()]
-
-            if foil_target:
-                listings = [l for l in listings if self.is_foil(l)]
-            else:
-                non_foils = [l for l in listings if not self.is_foil(l)]
-                if non_foils: listings = non_foils
-
+            listings = self.filter_listings(listings, zero_only, lang_target, foil_target)
+            inputs.append((target_bp['id'], card['_needed_qty'], listings))
             if not listings: continue
 
-            sorted_listings = sorted(listings, key=lambda x: x.get('price_cents', float('inf')))
-            needed = card['_needed_qty']
-            card_total = 0
-            card_found = 0
-            
-            for l in sorted_listings:
-                price = l.get('price_cents')
-                if price is None: continue
-                avail = l.get('quantity', 1)
-                to_take = min(avail, needed)
-                card_total += to_take * price
-                needed -= to_take
-                card_found += to_take
-                currency = l.get('price_currency', currency)
-                if needed <= 0: break
+            card_total, card_found, card_currency = self.fill_from_listings(listings, card['_needed_qty'])
+            currency = card_currency or currency
             
             if card_found > 0:
                 total_cost_cents += card_total
@@ -169,6 +195,8 @@ class RiftboundGame(BaseGame):
                     "link": f"https://www.cardtrader.com/cards/{target_bp['id']}"
                 })
 
+        if progress: progress(len(cards_to_buy), len(cards_to_buy))
+
         return {
             "rarity": rarity_target,
             "domain": domain_target,
@@ -178,5 +206,6 @@ class RiftboundGame(BaseGame):
             "total_cost": total_cost_cents / 100,
             "currency": currency,
             "using_inventory": bool(inventory),
-            "items": items_list
+            "items": items_list,
+            "fingerprint": self.pricing_fingerprint(len(cards_to_buy), inputs)
         }
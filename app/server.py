@@ -1,27 +1,144 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse, PlainTextResponse, JSONResponse
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 import os
-import re
+import json
+import hashlib
+import time
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from .core import database as db
-from .games.riftbound import RiftboundGame
-from .games.fab import FABGame
+from .core import jobs
+from .core import prefetch
+from .core import metrics
+from .core import timing
+from .core import ratelimit
+from .core.cache import TTLCache
+from .core.shared_cache import get_shared_cache
+from .core import api
+from .core import scheduler
+from .core import cart
+from .core import sellers
+from .core import pricelist
+from .games import GAMES
 
 app = FastAPI()
+# Large JSON bodies (grid rows with item lists) are compressed for clients that accept it
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 # Setup templates path relative to project root
 templates = Jinja2Templates(directory="app/templates")
 
-# Register supported games
-GAMES = {
-    "riftbound": RiftboundGame(),
-    "fab": FABGame()
-}
+# Hot read endpoints are served from memory; /latest entries are dropped as soon as
+# save_price writes a row for the same query, generated lists simply expire.
+response_cache = TTLCache(
+    maxsize=int(os.getenv('RESPONSE_CACHE_SIZE', '512')),
+    ttl=int(os.getenv('RESPONSE_CACHE_TTL', '300')),
+    name="response"
+)
+LIST_CACHE_TTL = int(os.getenv('LIST_CACHE_TTL', '3600'))
+
+INVENTORY_LISTING_MAX_AGE = int(os.getenv('INVENTORY_LISTING_MAX_AGE', '1800'))
+ESTIMATE_CONCURRENCY = int(os.getenv('ESTIMATE_CONCURRENCY', '8'))
+ESTIMATE_LISTING_MAX_AGE = int(os.getenv('ESTIMATE_LISTING_MAX_AGE', '900'))
+
+def _latest_cache_key(game_name, quantity, zero_only, language, expansion, foil, inventory_hash=None):
+    return ("latest", game_name, int(quantity), bool(zero_only), language, expansion, bool(foil), inventory_hash)
+
+def _invalidate_latest(game, rarity, domain, quantity, zero_only, language, expansion, foil, inventory_hash=None):
+    key = _latest_cache_key(game, quantity, zero_only, language, expansion, foil, inventory_hash)
+    response_cache.invalidate(key)
+    shared = get_shared_cache()
+    if shared:
+        # Other workers notice the bumped generation on their next read
+        shared.invalidate("latest", key)
+
+db.add_write_listener(_invalidate_latest)
+# Every listing snapshot that reaches the cache also feeds the seller index
+api.add_listing_listener(sellers.ingest)
+SELLER_INDEX_MAX_AGE = int(os.getenv('SELLER_INDEX_MAX_AGE', '3600'))
+
+def _etag_matches(request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """Reports per-phase spans in a Server-Timing header and logs slow requests."""
+    spans, token = timing.start()
+    begin = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        timing.stop(token)
+    total = time.perf_counter() - begin
+    response.headers["Server-Timing"] = timing.server_timing_header(spans, total)
+    timing.log_if_slow(request.method, request.url.path, str(request.query_params), response.status_code, spans, total)
+    return response
+
+# Warm-up: "blocking" finishes before the app accepts traffic, "background" serves
+# immediately and reports progress on /ready, "off" skips it.
+WARMUP_MODE = os.getenv('WARMUP', 'background').lower()
+WARMUP_EXPANSIONS = [e.strip().lower() for e in os.getenv('WARMUP_EXPANSIONS', '').split(',') if e.strip()]
+warmup_state = {"status": "pending", "started": None, "finished": None, "errors": []}
+
+# In-process periodic refresh, an alternative to running cron_update.py externally.
+# REFRESH_DAEMON_VARIANTS lists extra grids to keep fresh as "q:zero:lang" entries
+# (e.g. "1:1:en,3:1:en"); grids viewed on the dashboard are always included.
+REFRESH_DAEMON = os.getenv('REFRESH_DAEMON', '0').lower() in ('1', 'true', 'yes', 'on')
+REFRESH_DAEMON_VARIANTS = [
+    (int(q), z in ('1', 'true'), None if lang.lower() in ('', 'none', 'any') else lang, False)
+    for q, z, lang in (v.strip().split(':') for v in os.getenv('REFRESH_DAEMON_VARIANTS', '').split(',') if v.strip())
+]
+
+def _warm_up():
+    warmup_state.update(status="running", started=time.time())
+    for name, game in GAMES.items():
+        expansions = {
+            exp_name: exp_id for exp_name, exp_id in game.expansions.items()
+            if not WARMUP_EXPANSIONS or exp_name.lower() in WARMUP_EXPANSIONS
+        }
+        try:
+            with ratelimit.priority("background"):
+                warmup_state["errors"].extend(game.warm_up(expansions))
+        except Exception as e:
+            warmup_state["errors"].append(f"{name}: {e}")
+    warmup_state.update(status="done", finished=time.time())
 
 @app.on_event("startup")
 def startup_event():
     db.init_db()
+    shared = get_shared_cache()
+    if shared:
+        shared.purge(older_than=max(api.BLUEPRINT_CACHE_TTL, api.LISTING_CACHE_TTL))
+    if WARMUP_MODE == "blocking":
+        _warm_up()
+    elif WARMUP_MODE == "background":
+        threading.Thread(target=_warm_up, name="warmup", daemon=True).start()
+    else:
+        warmup_state["status"] = "done"
+    if REFRESH_DAEMON:
+        scheduler.start_daemon(GAMES, REFRESH_DAEMON_VARIANTS)
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until the warm-up phase has finished."""
+    status_code = 200 if warmup_state["status"] == "done" else 503
+    return JSONResponse(dict(warmup_state, ready=status_code == 200), status_code=status_code)
+
+@app.on_event("shutdown")
+def shutdown_event():
+    scheduler.stop_daemon()
+    scheduler.flush_access()
+    jobs.shutdown()
+    prefetch.shutdown()
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
@@ -47,81 +164,84 @@ async def generate_fab_list(
     rarity: str,
     expansion: str = None,
     quantity: int = 1,
-    deduplicate: bool = False
+    deduplicate: bool = False,
+    prefetch_listings: bool = False
 ):
     game = GAMES.get("fab")
     if not game:
         raise HTTPException(status_code=404, detail="FAB game not found")
-    
-    type_mapping = game.load_cards_mapping()
-    all_identities = sorted(type_mapping.keys(), key=len, reverse=True)
-    
-    expansions_to_check = {}
-    if not expansion or expansion.lower() == 'all':
-        expansions_to_check = game.expansions
-    else:
-        for exp_name, exp_id in game.expansions.items():
-            if expansion.lower() == exp_name.lower() or expansion.lower() in exp_name.lower():
-                expansions_to_check[exp_name] = exp_id
-    
+
+    cache_key = ("generate-list", class_name.lower(), rarity.lower(), (expansion or "all").lower(), quantity, deduplicate)
+    result = response_cache.get(cache_key)
+    if result is None:
+        result = await _generate_fab_list(game, class_name, rarity, expansion, quantity, deduplicate)
+        response_cache.set(cache_key, result, ttl=LIST_CACHE_TTL)
+
+    if prefetch_listings and result.get("blueprints"):
+        # Users usually hit "Estimate" next, so warm those listings speculatively
+        state = prefetch.start([b["id"] for b in result["blueprints"]], ESTIMATE_LISTING_MAX_AGE)
+        result = dict(result, prefetch_id=state["id"])
+    return result
+
+async def _generate_fab_list(game, class_name, rarity, expansion, quantity, deduplicate):
+    expansions_to_check = game.match_expansions(expansion)
     if not expansions_to_check:
         return {"items": []}
 
-    final_items = {}
-    from .core import api
-    
-    exp_code_regex = re.compile(r'\s*\([^)]*[A-Z]{3,}[^)]*\)\s*')
-    variant_regex = re.compile(r'\s*-\s*(unlimited|1st edition|rainbow foil|cold foil|foil).*', re.I)
+    # Lookup in the precomputed (class, rarity, expansion) index
+    final_items = await run_in_threadpool(game.list_cards, class_name, rarity, expansions_to_check, deduplicate)
 
-    for exp_name, exp_id in expansions_to_check.items():
-        try:
-            blueprints = api.fetch_blueprints(exp_id)
-            for bp in blueprints:
-                # 1. Rarity Filter
-                bp_rarity = bp.get('fixed_properties', {}).get('fab_rarity', '').lower()
-                if bp_rarity != rarity.lower():
-                    continue
-                
-                # 2. Identity Resolution
-                bp_name = bp['name']
-                norm_bp_name = game.normalize_name(bp_name)
-                
-                identity = None
-                for ident in all_identities:
-                    if norm_bp_name.startswith(ident):
-                        identity = ident
-                        break
-                
-                if not identity:
-                    continue
-                
-                # 3. Class Filter
-                card_types = type_mapping.get(identity, "")
-                if class_name.lower() in card_types.lower():
-                    # 4. Deduplication
-                    if deduplicate and identity in final_items:
-                        continue
-
-                    # Store name and the blueprint ID for later cost estimation
-                    clean_name = exp_code_regex.sub(' ', bp_name)
-                    clean_name = variant_regex.sub('', clean_name).strip()
-                    
-                    final_items[identity] = {
-                        "display_name": f"{quantity}x {clean_name}",
-                        "bp_id": bp['id'],
-                        "name": bp_name,
-                        "exp": exp_name
-                    }
-        except:
-            continue
-            
     # Sort by display name
-    sorted_data = sorted(final_items.values(), key=lambda x: x['display_name'].split('x ', 1)[1])
+    sorted_data = sorted(final_items.values(), key=lambda x: x['clean_name'])
     return {
-        "items": [d['display_name'] for d in sorted_data],
+        "items": [f"{quantity}x {d['clean_name']}" for d in sorted_data],
         "blueprints": [{"id": d['bp_id'], "name": d['name']} for d in sorted_data]
     }
 
+@app.get("/api/prefetch/{prefetch_id}")
+async def get_prefetch(prefetch_id: str):
+    state = prefetch.get_status(prefetch_id)
+    if not state:
+        raise HTTPException(status_code=404, detail="Prefetch not found")
+    return state
+
+@app.delete("/api/prefetch/{prefetch_id}")
+async def cancel_prefetch(prefetch_id: str):
+    state = prefetch.cancel(prefetch_id)
+    if not state:
+        raise HTTPException(status_code=404, detail="Prefetch not found")
+    return state
+
+def _estimate_cards(game, blueprint_ids, quantity, zero_only):
+    """Prices blueprints concurrently, yielding per-card results as they complete."""
+    executor = ThreadPoolExecutor(max_workers=ESTIMATE_CONCURRENCY)
+    try:
+        futures = {
+            executor.submit(
+                contextvars.copy_context().run,
+                game.estimate_blueprint, bp_id, quantity, zero_only, ESTIMATE_LISTING_MAX_AGE
+            ): bp_id
+            for bp_id in blueprint_ids
+        }
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                yield {"id": futures[future], "error": str(e)}
+    finally:
+        # Stops queued fetches if the client goes away mid-stream
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def _estimate_summary(results):
+    priced = [r for r in results if "error" not in r]
+    return {
+        "total_cost": round(sum(r["price"] for r in priced), 2),
+        "currency": priced[0]["currency"] if priced else "EUR",
+        "items": priced,
+        "missing": sum(r["missing"] for r in priced),
+        "failed": [{"id": r["id"], "error": r["error"]} for r in results if "error" in r]
+    }
+
 @app.post("/api/fab/estimate-cost")
 async def estimate_fab_cost(
     request: Request
@@ -135,39 +255,141 @@ async def estimate_fab_cost(
     if not game:
         raise HTTPException(status_code=404, detail="FAB game not found")
 
-    total_cost_cents = 0
-    from .core import api
-    
-    for bp_id in blueprint_ids:
-        try:
-            market_data = api.fetch_marketplace_products(bp_id)
-            listings = market_data.get(str(bp_id), [])
-            
-            if zero_only:
-                listings = [l for l in listings if l.get('user', {}).get('can_sell_via_hub')]
-            
-            listings = [l for l in listings if not l.get('graded') and l.get('properties_hash', {}).get('condition') in ['Near Mint', 'Mint']]
-            listings = [l for l in listings if not game.is_foil(l)]
-
-            if listings:
-                sorted_listings = sorted(listings, key=lambda x: x.get('price_cents', float('inf')))
-                needed = quantity
-                for l in sorted_listings:
-                    price = l.get('price_cents', 0)
-                    if price is None: continue
-                    avail = l.get('quantity', 1)
-                    to_take = min(avail, needed)
-                    total_cost_cents += to_take * price
-                    needed -= to_take
-                    if needed <= 0: break
-        except:
-            continue
-            
+    if body.get("stream"):
+        # NDJSON: one line per card as it completes, then a summary line
+        def stream():
+            results = []
+            for result in _estimate_cards(game, blueprint_ids, quantity, zero_only):
+                results.append(result)
+                yield json.dumps(dict(result, type="card")) + "\n"
+            summary = _estimate_summary(results)
+            del summary["items"]
+            yield json.dumps(dict(summary, type="total")) + "\n"
+        # Identity encoding keeps GZipMiddleware from buffering the stream
+        return StreamingResponse(stream(), media_type="application/x-ndjson", headers={"Content-Encoding": "identity"})
+
+    results = await run_in_threadpool(lambda: list(_estimate_cards(game, blueprint_ids, quantity, zero_only)))
+    return _estimate_summary(results)
+
+def _wanted_quantities(body):
+    """{blueprint_id: quantity} from a body with "items" ([{"blueprint_id", "quantity"}]) or "blueprint_ids" plus one "quantity"."""
+    wanted = {}
+    items = body.get("items") or [{"blueprint_id": bp_id, "quantity": body.get("quantity", 1)} for bp_id in body.get("blueprint_ids", [])]
+    for item in items:
+        bp_id = int(item["blueprint_id"])
+        wanted[bp_id] = wanted.get(bp_id, 0) + int(item.get("quantity", 1))
+    if not wanted:
+        raise HTTPException(status_code=400, detail="No blueprints given")
+    return wanted
+
+@app.post("/api/{game_name}/cart")
+async def optimize_cart(game_name: str, request: Request):
+    """
+    Cheapest way to buy a list of blueprints including shipping: one fee per seller parcel,
+    or a single CardTrader Zero parcel for hub-eligible listings.
+    Body: {"items": [{"blueprint_id", "quantity"}]} (or "blueprint_ids" plus one "quantity"),
+    optional "mode" (auto|heuristic|exact), "zero_only", "use_zero", "language",
+    "shipping_cents" and "zero_shipping_cents".
+    """
+    if game_name not in GAMES:
+        raise HTTPException(status_code=404, detail="Game not found")
+    body = await request.json()
+    mode = body.get("mode", "auto")
+    if mode not in ("auto", "heuristic", "exact"):
+        raise HTTPException(status_code=400, detail="mode must be auto, heuristic or exact")
+
+    return await run_in_threadpool(
+        cart.optimize, GAMES[game_name], _wanted_quantities(body),
+        zero_only=body.get("zero_only", False),
+        lang_target=body.get("language"),
+        mode=mode,
+        use_zero=body.get("use_zero", True),
+        seller_shipping=int(body.get("shipping_cents", cart.CART_SHIPPING_CENTS)),
+        zero_shipping=int(body.get("zero_shipping_cents", cart.CART_ZERO_SHIPPING_CENTS))
+    )
+
+@app.post("/api/{game_name}/sellers")
+async def rank_sellers(game_name: str, request: Request):
+    """
+    Sellers ranked by how many of the listed blueprints they cover, then by cost, answered
+    from the in-memory seller index. Body: "items" or "blueprint_ids" as for /cart, optional
+    "zero_only", "language", "limit" (default 20) and "refresh": fetch blueprints whose
+    indexed snapshot is missing or older than SELLER_INDEX_MAX_AGE before ranking.
+    """
+    if game_name not in GAMES:
+        raise HTTPException(status_code=404, detail="Game not found")
+    body = await request.json()
+    wanted = _wanted_quantities(body)
+
+    unindexed = sellers.missing(wanted, SELLER_INDEX_MAX_AGE)
+    if unindexed and body.get("refresh"):
+        await run_in_threadpool(cart.fetch_listings, unindexed, SELLER_INDEX_MAX_AGE)
+        unindexed = sellers.missing(wanted, SELLER_INDEX_MAX_AGE)
+
+    begin = time.perf_counter()
+    ranked = sellers.rank(
+        GAMES[game_name], wanted, body.get("zero_only", False), body.get("language"), int(body.get("limit", 20))
+    )
     return {
-        "total_cost": total_cost_cents / 100,
-        "currency": "EUR"
+        "sellers": ranked,
+        "not_indexed": unindexed,
+        "index": sellers.stats(),
+        "seconds": round(time.perf_counter() - begin, 4)
     }
 
+@app.post("/api/{game_name}/price-list")
+async def price_list(game_name: str, request: Request):
+    """
+    Prices a pasted 'Nx Card Name' list (wishlists_content files, generate_fab_list output).
+    Body: {"text": "..."} plus optional "zero_only", "language", "expansion" (only printings
+    from that expansion) and "fuzzy" (default true).
+    """
+    if game_name not in GAMES:
+        raise HTTPException(status_code=404, detail="Game not found")
+    game = GAMES[game_name]
+    body = await request.json()
+    text = body.get("text") or ""
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="Empty list")
+
+    expansion_ids = None
+    if body.get("expansion"):
+        expansion_ids = {
+            exp_id for exp_name, exp_id in game.expansions.items()
+            if exp_name.lower() == str(body["expansion"]).lower() or str(exp_id) == str(body["expansion"])
+        }
+        if not expansion_ids:
+            raise HTTPException(status_code=404, detail="Expansion not found")
+
+    return await run_in_threadpool(
+        pricelist.price_list, game, text, body.get("zero_only", False), body.get("language"),
+        expansion_ids, body.get("fuzzy", True)
+    )
+
+def _refresh_cell(progress, game_name, rarity, domain, q, z, lang, exp, f, inventory_hash, listing_max_age=None):
+    """Recomputes a single grid cell and stores it. Runs as a background job."""
+    game = GAMES[game_name]
+    with metrics.pricing_latency.time(game=game_name, cell=f"{rarity}/{domain}"):
+        result = game.calculate_collection_cost(
+            rarity, domain, q, z, lang, exp, f, inventory_hash is not None,
+            progress=progress, listing_max_age=listing_max_age
+        )
+
+    if "error" in result:
+        return result
+    if result.get("count", 0) == 0:
+        return None
+
+    # Inventory-aware results are stored under the collection fingerprint; a refresh that
+    # saw the same listings as the stored row only bumps its timestamp
+    db.save_price(
+        game_name, rarity, domain, q, z, lang, exp,
+        result["total_cost"], result["items_found"], result["count"], result["currency"], f,
+        result.get("items"), inventory_hash, fingerprint=result.get("fingerprint")
+    )
+    # Re-fetch from DB to get the JSON-parsed version + timestamp
+    return db.get_latest_price(game_name, rarity, domain, q, z, lang, exp, f, inventory_hash)
+
 @app.get("/api/{game_name}/price")
 async def get_price(
     game_name: str,
@@ -188,43 +410,105 @@ async def get_price(
     exp = e if e and e.lower() != "none" else None
     
     # Inventory check
-    inventory_path = f"data/{game_name}/collection.csv"
-    use_inventory = os.path.exists(inventory_path)
+    inventory_hash = game.collection_fingerprint()
+    # After a collection edit only the needed quantities change, so recent listings are reused
+    listing_max_age = INVENTORY_LISTING_MAX_AGE if inventory_hash and not force_refresh else None
     
-    if not use_inventory:
-        latest = db.get_latest_price(game_name, rarity, domain, q, z, lang, exp, f)
-        if latest and not force_refresh:
-            return dict(latest)
+    scheduler.record_access(game_name, rarity, domain, q, z, lang, exp, f)
 
-    # Call game-specific calculation
-    result = game.calculate_collection_cost(rarity, domain, q, z, lang, exp, f, use_inventory)
-    
-    if "error" not in result and result.get("count", 0) > 0:
-        if not use_inventory:
-            db.save_price(
-                game_name, rarity, domain, q, z, lang, exp,
-                result["total_cost"], result["items_found"], result["count"], result["currency"], f,
-                result.get("items")
-            )
-            # Re-fetch from DB to get the JSON-parsed version + timestamp
-            latest = db.get_latest_price(game_name, rarity, domain, q, z, lang, exp, f)
-            return dict(latest)
-        else:
-            # If using inventory, return results directly (not cached)
-            return result
+    # Identical refreshes share one job
+    job_key = ("price", game_name, rarity, domain, q, z, lang, exp, f, inventory_hash)
+    job_args = (game_name, rarity, domain, q, z, lang, exp, f, inventory_hash, listing_max_age)
+
+    if not force_refresh:
+        latest = db.get_latest_price(game_name, rarity, domain, q, z, lang, exp, f, inventory_hash)
+        if latest:
+            fresh_after, expire_after = game.freshness_policy(rarity, domain)
+            age = db.get_age_seconds(latest)
+            if age < expire_after:
+                metrics.cache_requests.inc(layer="cell", result="hit")
+                latest = dict(latest)
+                latest["age_seconds"] = int(age)
+                latest["stale"] = age >= fresh_after
+                if latest["stale"]:
+                    # Serve the stale row now and let the refresh converge in the background
+                    latest["refresh_job"] = jobs.submit(job_key, _refresh_cell, *job_args, priority="background")["id"]
+                return latest
+
+    metrics.cache_requests.inc(layer="cell", result="miss")
+    job = jobs.submit(job_key, _refresh_cell, *job_args)
+
+    if force_refresh:
+        # Don't hold the connection open, the client polls /api/jobs/{id}
+        return {"job_id": job["id"], "status": job["status"]}
+
+    job = await run_in_threadpool(jobs.wait, job["id"])
+    if job["status"] in ("error", "cancelled"):
+        return {"error": job["error"]}
+    result = job["result"]
+    if result and "timestamp" in result:
+        result = dict(result, age_seconds=int(db.get_age_seconds(result)), stale=False)
+    return result
+
+@app.get("/api/refresh-daemon")
+async def refresh_daemon_status():
+    return dict(scheduler.daemon_state, enabled=REFRESH_DAEMON, interval=scheduler.DAEMON_INTERVAL)
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @app.get("/api/{game_name}/latest")
-async def get_all_latest(game_name: str, q: int = 1, z: bool = False, l: str = None, e: str = None, f: bool = False):
+async def get_all_latest(request: Request, game_name: str, q: int = 1, z: bool = False, l: str = None, e: str = None, f: bool = False):
     if game_name not in GAMES:
         raise HTTPException(status_code=404, detail="Game not found")
     
-    inventory_path = f"data/{game_name}/collection.csv"
-    if os.path.exists(inventory_path):
-        return []
-    
+    inventory_hash = GAMES[game_name].collection_fingerprint()
     lang = l if l and l.lower() != "none" else None
     exp = e if e and e.lower() != "none" else None
-    return db.get_all_latest(game_name, q, z, lang, exp, f)
+    scheduler.record_access(game_name, "*", "*", q, z, lang, exp, f)
+
+    # Cached entries hold the serialized body and its ETag, so hits skip SQLite and JSON encoding
+    cache_key = _latest_cache_key(game_name, q, z, lang, exp, f, inventory_hash)
+    shared = get_shared_cache()
+    generation = shared.generation("latest", cache_key) if shared else 0
+
+    cached = response_cache.get(cache_key)
+    if cached is not None and cached["generation"] != generation:
+        cached = None
+    if cached is None:
+        version = db.get_latest_version(game_name, q, z, lang, exp, f, inventory_hash)
+        etag = '"%s"' % hashlib.sha1(repr((cache_key, version)).encode()).hexdigest()
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        # Writers outside this server (cron_update.py) never bump the generation, so a shared
+        # body is only reused while it was built from the newest rows
+        entry = shared.get("latest", cache_key) if shared else None
+        if entry and entry[1]["generation"] == generation and entry[1]["etag"] == etag:
+            cached = dict(entry[1], body=entry[1]["body"].encode())
+            response_cache.set(cache_key, cached)
+    if cached is None:
+        rows = db.get_all_latest(game_name, q, z, lang, exp, f, inventory_hash)
+        body = json.dumps(rows, separators=(",", ":"))
+        cached = {"etag": etag, "body": body.encode(), "generation": generation}
+        response_cache.set(cache_key, cached)
+        if shared:
+            shared.set("latest", cache_key, {"etag": etag, "body": body, "generation": generation})
+
+    if _etag_matches(request, cached["etag"]):
+        return Response(status_code=304, headers={"ETag": cached["etag"]})
+    return Response(content=cached["body"], media_type="application/json", headers={"ETag": cached["etag"]})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return response_cache.stats()
 
 if __name__ == "__main__":
     import argparse
@@ -1,58 +1,195 @@
-import time
 import argparse
-from app.games.riftbound import RiftboundGame
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from app.games import GAMES
 from app.core import database as db
+from app.core import ratelimit
+from app.core import scheduler
 
-def run_update(game_name, quantities, zero_only, languages):
+# Listing snapshots up to this old are reused within a sweep, so a blueprint shared by
+# several cells (languages, quantities, multi-domain cards) is fetched once per sweep
+SWEEP_LISTING_MAX_AGE = int(os.getenv('SWEEP_LISTING_MAX_AGE', '1800'))
+
+def select_games(game_name):
+    if game_name == "all":
+        return dict(GAMES)
+    if game_name in GAMES:
+        return {game_name: GAMES[game_name]}
+    print(f"Game {game_name} not supported. Choose one of: {', '.join(GAMES)} or all.")
+    return None
+
+def run_update(game_name, quantities, zero_only, languages, resume=None, full=False, processes=1):
     """
     Iterates through combinations and updates the database.
+    Progress is checkpointed per cell under a sweep ID; `resume` ("latest" or a sweep ID)
+    continues an interrupted sweep instead of starting over.
+    Cells whose listings haven't changed since their last row are only touched, unless `full`.
+    With processes > 1, (game, expansion) shards are priced in parallel worker processes.
     """
     db.init_db()
-    
-    if game_name == "riftbound":
-        game = RiftboundGame()
-    else:
-        print(f"Game {game_name} not supported for cron yet.")
+    # Pacing comes from the shared API rate limiter; cron yields to interactive traffic
+    ratelimit.set_process_priority("cron")
+
+    games = select_games(game_name)
+    if not games:
         return
 
-    total_updates = 0
-    print(f"Starting automated update for {game_name}...")
-    
+    params = {"quantities": quantities, "zero_only": zero_only, "languages": languages}
+    sweep = None
+    if resume == "latest":
+        sweep = db.find_unfinished_sweep(game_name, params)
+        if not sweep:
+            print("No interrupted sweep with these parameters, starting a new one.")
+    elif resume:
+        sweep = db.get_sweep(resume)
+        if not sweep or sweep["game"] != game_name:
+            print(f"Sweep {resume} not found for {game_name}.")
+            return
+        params = json.loads(sweep["params_json"])
+        quantities, zero_only, languages = params["quantities"], params["zero_only"], params["languages"]
+
+    if sweep:
+        sweep_id = sweep["id"]
+        completed = db.get_completed_cells(sweep_id)
+        print(f"Resuming sweep {sweep_id} ({len(completed)} cells already done)...")
+    else:
+        sweep_id = db.create_sweep(game_name, params)
+        completed = set()
+        print(f"Starting automated update for {game_name} (sweep {sweep_id})...")
+
+    shards = [(name, exp) for name, game in games.items() for exp in game.sweep_expansions]
+    counts = {"saved": 0, "unchanged": 0, "skipped": 0}
+
+    if processes > 1:
+        # Shards run in separate processes (own HTTP session, shared SQLite rate limiter);
+        # each finished shard lands in one bulk transaction
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=_init_worker) as pool:
+            futures = [
+                pool.submit(_sweep_shard, name, exp, quantities, zero_only, languages, completed, full)
+                for name, exp in shards
+            ]
+            for future in as_completed(futures):
+                name, exp, rows, skipped = future.result()
+                _write_shard(sweep_id, rows, skipped, counts)
+                print(f"Shard {name} {exp or 'All sets'}: {len(rows)} priced, {len(skipped)} skipped")
+    else:
+        for name, exp in shards:
+            game = GAMES[name]
+            for cell, q, z, lang, r, d in _shard_cells(name, game, exp, quantities, zero_only, languages):
+                if cell in completed:
+                    continue
+                print(f"Fetching: {name} {exp or 'All sets'} | {r} {d} | Qty: {q} | Zero: {z} | Lang: {lang}")
+                row, error = _price_cell(name, game, exp, q, z, lang, r, d, cell, full)
+                if row:
+                    status = _write_shard(sweep_id, [row], [], counts)[0]
+                    print(f"  {'Unchanged' if status == 'unchanged' else 'Saved'}: {row['price']} {row['currency']}")
+                else:
+                    _write_shard(sweep_id, [], [cell], counts)
+                    print(f"  Skipped: {error}")
+
+    db.finish_sweep(sweep_id)
+    print(f"\nUpdate complete. Total records added: {counts['saved']} ({counts['unchanged']} unchanged cells touched)")
+
+def _shard_cells(name, game, exp, quantities, zero_only, languages):
+    """Yields (cell key, quantity, zero_only, language, rarity, domain) for one (game, expansion) shard."""
     for q in quantities:
         for z in zero_only:
             for lang in languages:
                 actual_lang = None if lang.lower() in ["none", "any", "all"] else lang
-                
                 for r in game.rarities:
                     for d in game.domains:
-                        print(f"Fetching: {r} {d} | Qty: {q} | Zero: {z} | Lang: {actual_lang}")
-                        
-                        result = game.calculate_collection_cost(r, d, q, z, actual_lang)
-                        
-                        if "error" not in result and result.get("count", 0) > 0:
-                            db.save_price(
-                                game_name, r, d, q, z, actual_lang, None,
-                                result["total_cost"], 
-                                result["items_found"], 
-                                result["count"], 
-                                result["currency"]
-                            )
-                            print(f"  Saved: {result['total_cost']} {result['currency']}")
-                            total_updates += 1
-                        else:
-                            print(f"  Skipped: {result.get('error', 'No cards found')}")
-                        
-                        time.sleep(1.5)
-
-    print(f"\nUpdate complete. Total records added: {total_updates}")
+                        yield json.dumps([name, q, z, actual_lang, exp, r, d]), q, z, actual_lang, r, d
+
+def _price_cell(name, game, exp, q, z, lang, r, d, cell, full):
+    """Returns (save_prices row, None) for a priced cell or (None, reason) when it is skipped."""
+    result = game.calculate_collection_cost(r, d, q, z, lang, exp, listing_max_age=SWEEP_LISTING_MAX_AGE)
+    if "error" in result or result.get("count", 0) == 0:
+        return None, result.get('error', 'No cards found')
+    return dict(
+        game=name, rarity=r, domain=d, quantity=q, zero_only=z, language=lang, expansion=exp,
+        price=result["total_cost"], items_found=result["items_found"], total_cards=result["count"],
+        currency=result["currency"], sweep_cell=cell, fingerprint=None if full else result.get("fingerprint")
+    ), None
+
+def _write_shard(sweep_id, rows, skipped, counts):
+    """Saves priced rows and checkpoints every handled cell; returns the save statuses."""
+    statuses = db.save_prices([dict(row, sweep_id=sweep_id) for row in rows]) if rows else []
+    checkpoints = [(row["sweep_cell"], status or "saved") for row, status in zip(rows, statuses)]
+    checkpoints += [(cell, "skipped") for cell in skipped]
+    db.checkpoint_cells(sweep_id, checkpoints)
+    for _, status in checkpoints:
+        counts[status] += 1
+    return statuses
+
+def _init_worker():
+    ratelimit.set_process_priority("cron")
+
+def _sweep_shard(name, exp, quantities, zero_only, languages, completed, full):
+    """Prices one (game, expansion) shard in a worker process. Writes nothing; rows go back to the parent."""
+    game = GAMES[name]
+    rows, skipped = [], []
+    for cell, q, z, lang, r, d in _shard_cells(name, game, exp, quantities, zero_only, languages):
+        if cell in completed:
+            continue
+        row, _ = _price_cell(name, game, exp, q, z, lang, r, d, cell, full)
+        if row:
+            rows.append(row)
+        else:
+            skipped.append(cell)
+    return name, exp, rows, skipped
+
+def run_scheduled(game_name, quantities, zero_only, languages, max_seconds=None, max_calls=None):
+    """
+    Refreshes the most urgent cells first (stalest, most viewed, most volatile) across
+    games and expansions, stopping when the time or API call budget runs out.
+    """
+    db.init_db()
+    ratelimit.set_process_priority("cron")
+
+    games = select_games(game_name)
+    if not games:
+        return
+
+    variants = [
+        (q, z, None if lang.lower() in ["none", "any", "all"] else lang, False)
+        for q in quantities for z in zero_only for lang in languages
+    ]
+    print(f"Scheduling refreshes for {', '.join(games)}...")
+    summary = scheduler.run(
+        games, variants, max_seconds=max_seconds, max_calls=max_calls,
+        listing_max_age=SWEEP_LISTING_MAX_AGE, log=print
+    )
+    stopped = f", stopped on {summary['stopped']}" if summary["stopped"] else ""
+    print(
+        f"\nRefreshed {summary['refreshed']}/{summary['planned']} due cells in {summary['seconds']}s "
+        f"({summary['calls']} API calls{stopped}): {summary['saved']} saved, "
+        f"{summary['unchanged']} unchanged, {summary['empty']} empty, {summary['errors']} errors"
+    )
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Cron script to update card prices.")
-    parser.add_argument("-g", "--game", default="riftbound", help="Game name (default: riftbound)")
+    parser.add_argument("-g", "--game", default="riftbound", help="Game name or 'all' (default: riftbound)")
     parser.add_argument("-q", "--quantities", type=int, nargs="+", default=[1])
     parser.add_argument("-l", "--languages", type=str, nargs="+", default=["en"])
     parser.add_argument("-z", "--zero", type=int, nargs="+", default=[1])
+    parser.add_argument("--resume", nargs="?", const="latest", default=None, metavar="SWEEP_ID",
+                        help="Continue an interrupted sweep (the latest one with the same parameters, or SWEEP_ID)")
+    parser.add_argument("--full", action="store_true",
+                        help="Insert a new row for every cell, even when its listings haven't changed")
+    parser.add_argument("-p", "--processes", type=int, default=1,
+                        help="Worker processes for a full sweep, one (game, expansion) shard each at a time (0 = all cores)")
+    parser.add_argument("--schedule", action="store_true",
+                        help="Refresh the most urgent cells first instead of sweeping every cell in order")
+    parser.add_argument("--max-seconds", type=float, default=None, help="Time budget for --schedule")
+    parser.add_argument("--max-calls", type=int, default=None, help="CardTrader API call budget for --schedule")
 
     args = parser.parse_args()
     zero_bools = [bool(val) for val in args.zero]
-    run_update(args.game, args.quantities, zero_bools, args.languages)
+    if args.schedule:
+        run_scheduled(args.game, args.quantities, zero_bools, args.languages, args.max_seconds, args.max_calls)
+    else:
+        processes = args.processes or os.cpu_count()
+        run_update(args.game, args.quantities, zero_bools, args.languages, resume=args.resume, full=args.full, processes=processes)
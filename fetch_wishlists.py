@@ -1,105 +1,168 @@
 import os
-import requests
 import re
+import csv
+import time
 import argparse
-from dotenv import load_dotenv
-
-# Common Riftbound expansion mapping
-EXPANSIONS = {
-    'origins': 4166,
-    'promos': 4167,
-    'proving_grounds': 4275,
-    'arcane': 4289,
-    'spiritforged': 4299,
-    'unleashed': 4425
-}
+from concurrent.futures import ThreadPoolExecutor
+from app.core import api
+from app.core import names
+from app.core import pricelist
+from app.core import ratelimit
+from app.games import GAMES
+
+# Concurrent wishlist detail and listing fetches (the shared rate limiter still paces them)
+WISHLIST_WORKERS = int(os.getenv('WISHLIST_WORKERS', '8'))
+# Expansions with at least this many wanted blueprints are fetched with one marketplace call
+WISHLIST_EXPANSION_FETCH_MIN = int(os.getenv('WISHLIST_EXPANSION_FETCH_MIN', '10'))
+# Listing snapshots up to this old are reused instead of refetched
+WISHLIST_LISTING_MAX_AGE = int(os.getenv('WISHLIST_LISTING_MAX_AGE', '900'))
+
+CSV_FIELDS = ["quantity", "name", "expansion", "blueprint_id", "found", "best_price", "total", "currency", "link"]
 
 def sanitize_filename(name):
     return re.sub(r'[\\/*?:"<>|]', "", name).strip()
 
-def fetch_wishlist_contents(expansion_target=None, zero_only=False):
-    load_dotenv(dotenv_path='env')
-    api_token = os.getenv('API_CARDTRADER')
-    if not api_token:
+def resolve_expansion(game, target):
+    """Expansion ID for a name ('proving_grounds', 'Proving Grounds') or numeric ID, else None."""
+    if str(target).isdigit():
+        return int(target)
+    wanted = game.normalize_name(target)
+    for exp_name, exp_id in game.expansions.items():
+        if game.normalize_name(exp_name) == wanted:
+            return exp_id
+    return None
+
+def fetch_details(wishlists):
+    """Wishlist details fetched concurrently: [(wishlist, details or None, error or None)]."""
+    def fetch(wishlist):
+        try:
+            return wishlist, api.fetch_wishlist_details(wishlist['id']), None
+        except Exception as e:
+            return wishlist, None, str(e)
+
+    with ThreadPoolExecutor(max_workers=WISHLIST_WORKERS) as pool:
+        return list(pool.map(fetch, wishlists))
+
+def price_items(game, items, listings, zero_only=False):
+    """
+    [(item, row)] with a CSV_FIELDS row per resolved wishlist item: the cheapest way to cover
+    each quantity under the dashboard rules. With zero_only, items no Zero seller offers are dropped.
+    """
+    rows = []
+    for item, match in items:
+        qty = item.get('quantity', 1)
+        row = {"quantity": qty, "name": item.get('meta_name', 'Unknown'), "found": 0}
+        if match:
+            exp_name, bp = match
+            eligible = game.filter_listings(listings.get(bp['id'], []), zero_only)
+            if zero_only and not eligible:
+                continue
+            cost, found, currency = game.fill_from_listings(eligible, qty)
+            priced = [l['price_cents'] for l in eligible if l.get('price_cents') is not None]
+            row.update(
+                name=bp['name'], expansion=exp_name, blueprint_id=bp['id'], found=found,
+                best_price=min(priced) / 100 if priced else None,
+                total=cost / 100 if found else None, currency=currency,
+                link=f"https://www.cardtrader.com/cards/{bp['id']}"
+            )
+        elif zero_only:
+            continue
+        rows.append((item, row))
+    return rows
+
+def write_wishlist(path, priced):
+    """Writes the 'Nx name' list and, next to it, a CSV with per-item prices and a total row."""
+    with open(path + ".txt", 'w') as f:
+        for item, _ in priced:
+            f.write(f"{item.get('quantity', 1)}x {item.get('meta_name', 'Unknown')}\n")
+
+    rows = [row for _, row in priced]
+    total = sum(r.get("total") or 0 for r in rows)
+    currency = next((r["currency"] for r in rows if r.get("currency")), "EUR")
+    with open(path + ".csv", 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+        writer.writerow({"name": "TOTAL", "quantity": sum(r["quantity"] for r in rows),
+                         "found": sum(r["found"] for r in rows), "total": round(total, 2), "currency": currency})
+    return total, currency
+
+def fetch_wishlist_contents(expansion_target=None, zero_only=False, game_name="riftbound"):
+    if not api.API_TOKEN:
         print("Error: API_CARDTRADER not found.")
         return
 
-    headers = {"Authorization": f"Bearer {api_token}"}
-    
+    start = time.time()
+    ratelimit.set_process_priority("background")
+    game = GAMES[game_name]
+
     # Resolve expansion ID if provided
     target_exp_id = None
     if expansion_target:
-        if str(expansion_target).isdigit():
-            target_exp_id = int(expansion_target)
-        else:
-            target_exp_id = EXPANSIONS.get(expansion_target.lower())
-            if not target_exp_id:
-                print(f"Error: Unknown expansion '{expansion_target}'.")
-                return
-
-    # 1. Fetch all wishlists
-    list_url = "https://api.cardtrader.com/api/v2/wishlists"
+        target_exp_id = resolve_expansion(game, expansion_target)
+        if not target_exp_id:
+            print(f"Error: Unknown expansion '{expansion_target}'.")
+            return
+
+    # 1. Fetch all wishlists, then their details concurrently
     try:
-        response = requests.get(list_url, headers=headers)
-        response.raise_for_status()
-        wishlists = response.json()
+        wishlists = api.fetch_wishlists()
     except Exception as e:
         print(f"Error: {e}")
         return
+    details = fetch_details(wishlists)
+
+    # 2. Resolve every item to a blueprint through the cached name index
+    index = names.get_index(game)
+    expansion_ids = {target_exp_id} if target_exp_id else None
+    resolved, wanted = [], {}
+    for wishlist, data, error in details:
+        items = []
+        for item in (data or {}).get('items', []):
+            match = names.lookup(game, item.get('meta_name', ''), expansion_ids, index)
+            if target_exp_id and not match:
+                continue
+            items.append((item, match))
+            if match:
+                bp = match[1]
+                wanted[bp['id']] = bp.get('expansion_id', game.expansions.get(match[0]))
+        resolved.append((wishlist, items, error))
+
+    # 3. One concurrent listing pass covers every wishlist
+    listings, errors = pricelist.fetch_listings(
+        wanted, WISHLIST_LISTING_MAX_AGE, WISHLIST_EXPANSION_FETCH_MIN, WISHLIST_WORKERS
+    )
+    for error in errors:
+        print(f"  Error fetching listings for {error}")
 
     output_dir = "wishlists_content"
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    # 2. Process each wishlist
-    for wishlist in wishlists:
+    # 4. Price and write each wishlist
+    for wishlist, items, error in resolved:
         w_id = wishlist['id']
         w_name = wishlist['name']
         print(f"Processing: {w_name}...")
-        
-        detail_url = f"https://api.cardtrader.com/api/v2/wishlists/{w_id}"
-        try:
-            d_res = requests.get(detail_url, headers=headers)
-            d_res.raise_for_status()
-            wishlist_data = d_res.json()
-            items = wishlist_data.get('items', [])
-            
-            # Filtering
-            filtered_items = []
-            for item in items:
-                # To check expansion or zero, we might need more details if not in DeckItem
-                # The API reference says DeckItem has meta_name, but not expansion_id directly.
-                # However, many items in wishlists map to blueprints.
-                
-                # If target_exp_id or zero_only is set, we might need to skip items 
-                # that don't provide this info or fetch their blueprint.
-                # For now, we'll assume basic filtering by expansion code if present 
-                # or just mention it's limited by what the wishlist item provides.
-                
-                # Note: The DeckItem from /wishlists/:id is simplified. 
-                # To be 100% sure of expansion/zero, we'd need to look up the blueprint.
-                # This might be slow for large wishlists.
-                
-                filtered_items.append(item)
-
-            filename = f"{sanitize_filename(w_name)}_{w_id}.txt"
-            filepath = os.path.join(output_dir, filename)
-            
-            with open(filepath, 'w') as f:
-                for item in filtered_items:
-                    qty = item.get('quantity', 1)
-                    name = item.get('meta_name', 'Unknown')
-                    f.write(f"{qty}x {name}\n")
-            
-            print(f"  -> Saved {len(filtered_items)} items.")
+        if error:
+            print(f"  -> Error: {error}")
+            continue
 
-        except Exception as e:
-            print(f"  -> Error: {e}")
+        priced = price_items(game, items, listings, zero_only)
+        path = os.path.join(output_dir, f"{sanitize_filename(w_name)}_{w_id}")
+        total, currency = write_wishlist(path, priced)
+        unresolved = sum(1 for _, match in items if not match)
+        missing = sum(row["quantity"] - row["found"] for _, row in priced)
+        print(f"  -> Saved {len(priced)} items, total {total:.2f} {currency}"
+              f" ({missing} copies unavailable, {unresolved} names not matched).")
+
+    print(f"Priced {len(resolved)} wishlist(s) in {time.time() - start:.1f}s.")
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Fetch CardTrader wishlists.")
-    parser.add_argument("-e", "--expansion", help="Filter by expansion (experimental)")
-    parser.add_argument("-z", "--zero", action="store_true", help="Filter by Zero (experimental)")
+    parser = argparse.ArgumentParser(description="Fetch CardTrader wishlists with per-item best prices.")
+    parser.add_argument("-g", "--game", default="riftbound", choices=list(GAMES), help="Game (default: riftbound)")
+    parser.add_argument("-e", "--expansion", help="Only keep items printed in this expansion (name or ID)")
+    parser.add_argument("-z", "--zero", action="store_true", help="Only price CardTrader Zero listings, dropping items no Zero seller has")
     args = parser.parse_args()
-    
-    fetch_wishlist_contents(args.expansion, args.zero)
+
+    fetch_wishlist_contents(args.expansion, args.zero, args.game)
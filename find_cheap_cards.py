@@ -1,142 +1,145 @@
-import os
-import requests
-import statistics
+import sys
 import argparse
-from dotenv import load_dotenv
-
-# Common Riftbound expansion mapping
-EXPANSIONS = {
-    'origins': 4166,
-    'proving grounds': 4275,
-    'sfd': 4299,
-    'spiritforged': 4299,
-    'arcane': 4289,
-    'unleashed': 4425
-}
-
-def find_cheap_cards(rarity_target, lang_target=None, expansion_target=4166, zero_only=False):
-    load_dotenv(dotenv_path='env')
-    api_token = os.getenv('API_CARDTRADER')
-    if not api_token:
-        print("Error: API_CARDTRADER not found.")
-        return
-
-    headers = {"Authorization": f"Bearer {api_token}"}
-    
-    # Resolve expansion ID
-    exp_id = expansion_target
-    if isinstance(expansion_target, str):
-        if expansion_target.isdigit():
-            exp_id = int(expansion_target)
+from app.core import api
+from app.core import database as db
+from app.core import deals
+from app.core import ratelimit
+from app.games import GAMES
+
+def resolve_expansions(game, names):
+    """Maps expansion names/IDs ('all' for every set) to {name: id}, one entry per expansion ID."""
+    if any(n.lower() == 'all' for n in names):
+        names = list(game.expansions)
+    by_name = {exp_name.lower(): (exp_name, exp_id) for exp_name, exp_id in game.expansions.items()}
+
+    resolved, seen = {}, set()
+    for name in names:
+        if name.isdigit():
+            exp_name, exp_id = name, int(name)
+        elif name.lower() in by_name:
+            exp_name, exp_id = by_name[name.lower()]
         else:
-            exp_id = EXPANSIONS.get(expansion_target.lower())
-            if not exp_id:
-                print(f"Error: Unknown expansion name '{expansion_target}'.")
-                print(f"Known names: {', '.join(EXPANSIONS.keys())}")
-                return
-
-    # 1. Fetch Blueprints for the expansion
-    print(f"Fetching blueprints for expansion ID {exp_id}...")
-    bp_url = "https://api.cardtrader.com/api/v2/blueprints/export"
-    params = {"expansion_id": exp_id}
-    try:
-        response = requests.get(bp_url, headers=headers, params=params)
-        response.raise_for_status()
-        all_blueprints = response.json()
-    except Exception as e:
-        print(f"Error fetching blueprints: {e}")
+            print(f"Error: Unknown expansion name '{name}'.")
+            print(f"Known names: {', '.join(game.expansions)}")
+            return None
+        if exp_id not in seen:
+            seen.add(exp_id)
+            resolved[exp_name] = exp_id
+    return resolved
+
+def find_cheap_cards(rarities=None, lang_target=None, expansions=("origins",), zero_only=False, game_name="riftbound",
+                     max_ratio=0.8, min_listings=4, sort="discount", output_format="text", output=None,
+                     history=True, min_z=2.0):
+    if not api.API_TOKEN:
+        print("Error: API_CARDTRADER not found.")
         return
 
-    # 2. Filter by Rarity
-    target_blueprints = [
-        bp for bp in all_blueprints 
-        if bp.get('fixed_properties', {}).get('riftbound_rarity', '').lower() == rarity_target.lower()
-    ]
+    # Bulk scan: share the API quota politely with the dashboard
+    ratelimit.set_process_priority("background")
 
-    if not target_blueprints:
-        print(f"No cards found with rarity: {rarity_target}")
+    game = GAMES[game_name]
+    selected = resolve_expansions(game, expansions)
+    if not selected:
         return
 
-    lang_str = f" in language '{lang_target}'" if lang_target else ""
-    zero_str = " (Zero Only)" if zero_only else ""
-    print(f"Found {len(target_blueprints)} cards with rarity '{rarity_target}'{lang_str}{zero_str}. Checking prices...")
-
-    # 3. Check Marketplace Listings for each blueprint
-    for bp in target_blueprints:
-        bp_id = bp['id']
-        bp_name = bp['name']
-        
-        market_url = "https://api.cardtrader.com/api/v2/marketplace/products"
-        market_params = {"blueprint_id": bp_id}
-        
-        try:
-            m_response = requests.get(market_url, headers=headers, params=market_params)
-            m_response.raise_for_status()
-            data = m_response.json()
-            
-            listings = data.get(str(bp_id), [])
-            
-            if not listings:
-                continue
-
-            if zero_only:
-                listings = [l for l in listings if l.get('user', {}).get('can_sell_via_hub') is True]
-
-            # FILTER: High condition only, no graded
-            listings = [
-                l for l in listings 
-                if not l.get('graded', False) 
-                and l.get('properties_hash', {}).get('condition') in ['Near Mint', 'Mint']
-            ]
+    if history:
+        db.init_db()
 
-            if lang_target:
-                listings = [
-                    l for l in listings 
-                    if l.get('properties_hash', {}).get('riftbound_language', '').lower() == lang_target.lower()
-                ]
+    print(f"Scanning {len(selected)} expansion(s): {', '.join(selected)}...", file=sys.stderr)
+    found, errors = deals.scan(
+        game, selected, sort=sort, rarities=rarities, lang_target=lang_target,
+        zero_only=zero_only, max_ratio=max_ratio, min_listings=min_listings,
+        history=history, min_z=min_z
+    )
+    for error in errors:
+        print(f"  Error scanning {error}", file=sys.stderr)
 
-            if not listings:
-                continue
-
-            # FOIL LOGIC: Prioritize non-foils
-            def is_foil(l):
-                props = l.get('properties_hash', {})
-                return props.get('riftbound_foil') or props.get('foil')
-
-            non_foils = [l for l in listings if not is_foil(l)]
-            if non_foils:
-                listings = non_foils
-
-            prices = sorted([l['price_cents'] for l in listings if 'price_cents' in l])
-            
-            if len(prices) < 4:
-                continue 
+    f = open(output, "w", newline="", encoding="utf-8") if output else sys.stdout
+    try:
+        if output_format == "json":
+            deals.write_json(found, f)
+        elif output_format == "csv":
+            deals.write_csv(found, f)
+        else:
+            for d in found:
+                print(f"\n[CHEAP FIND] {d['name']} ({d['rarity']}, {d['expansion']}, {lang_target if lang_target else 'Any Lang'})", file=f)
+                print(f"  Cheapest: {d['price']:.2f} {d['currency']}", file=f)
+                if d['basis'] == "history":
+                    print(f"  Usual Price: {d['floor']:.2f} {d['currency']} ({d['z']} std below, {d['listings']} listings)", file=f)
+                else:
+                    print(f"  Floor Avg: {d['floor']:.2f} {d['currency']} ({d['listings']} listings)", file=f)
+                print(f"  Discount vs Floor: {d['discount'] * 100:.1f}% (saves {d['savings']:.2f})", file=f)
+                print(f"  Link: {d['link']}", file=f)
+    finally:
+        if output:
+            f.close()
+    print(f"{len(found)} deal(s) found.", file=sys.stderr)
+
+def watch_cheap_cards(rarities=None, lang_target=None, expansions=("origins",), zero_only=False, game_name="riftbound",
+                      max_ratio=0.8, min_listings=4, interval=30, webhook=None, alerts_db=False,
+                      history=True, min_z=2.0):
+    """Polls the expansions until interrupted and reports each new deal as it appears."""
+    if not api.API_TOKEN:
+        print("Error: API_CARDTRADER not found.")
+        return
 
-            cheapest = prices[0]
-            comparison_pool = prices[1:6] 
-            floor_avg = statistics.mean(comparison_pool)
-            
-            if cheapest <= floor_avg * 0.80:
-                currency = listings[0].get('price_currency', '???')
-                print(f"\n[CHEAP FIND] {bp_name} ({lang_target if lang_target else 'Any Lang'})")
-                print(f"  Cheapest: {cheapest/100:.2f} {currency}")
-                print(f"  Floor Avg (Next {len(comparison_pool)}): {floor_avg/100:.2f} {currency}")
-                print(f"  Discount vs Floor: {((1 - cheapest/floor_avg)*100):.1f}%")
-                print(f"  Link: https://www.cardtrader.com/cards/{bp_id}")
+    ratelimit.set_process_priority("background")
+    game = GAMES[game_name]
+    selected = resolve_expansions(game, expansions)
+    if not selected:
+        return
 
-        except Exception as e:
-            print(f"  Error checking {bp_name}: {e}")
+    sinks = [deals.stdout_sink]
+    if webhook:
+        sinks.append(deals.webhook_sink(webhook))
+    if alerts_db or history:
+        db.init_db()
+    if alerts_db:
+        sinks.append(deals.db_sink)
+
+    watcher = deals.DealWatcher(
+        game, selected, sinks, rarities=rarities, lang_target=lang_target,
+        zero_only=zero_only, max_ratio=max_ratio, min_listings=min_listings,
+        history=history, min_z=min_z
+    )
+    print(f"Watching {', '.join(selected)} every {interval}s (first poll records the baseline)...", file=sys.stderr)
+    try:
+        watcher.watch(interval, on_error=lambda e: print(f"  Poll failed: {e}", file=sys.stderr))
+    except KeyboardInterrupt:
+        print(f"Stopped after {watcher.polls} poll(s).", file=sys.stderr)
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Find cheap Riftbound cards on CardTrader.")
-    parser.add_argument("rarity", nargs="?", help="Rarity level (e.g., Epic, Rare)")
+    parser = argparse.ArgumentParser(description="Find underpriced cards on CardTrader across whole expansions.")
+    parser.add_argument("rarity", nargs="?", help="Rarity level (e.g., Epic, Rare); comma-separated or omitted for all")
     parser.add_argument("language", nargs="?", help="Language code (e.g., en, fr)")
-    parser.add_argument("-e", "--expansion", default="origins", help="Expansion name or ID (default: origins)")
+    parser.add_argument("-g", "--game", default="riftbound", choices=list(GAMES), help="Game (default: riftbound)")
+    parser.add_argument("-e", "--expansion", nargs="+", default=["origins"], help="Expansion names or IDs, or 'all' (default: origins)")
     parser.add_argument("-z", "--zero", action="store_true", help="Only CardTrader Zero compatible listings")
+    parser.add_argument("--max-ratio", type=float, default=0.8, help="Cheapest price must be at most this fraction of the floor (default: 0.8)")
+    parser.add_argument("--min-listings", type=int, default=4, help="Skip blueprints with fewer eligible listings (default: 4)")
+    parser.add_argument("--no-history", action="store_true",
+                        help="Judge each listing against the current snapshot only, without the stored per-card price history")
+    parser.add_argument("--min-z", type=float, default=2.0,
+                        help="With history, how many standard deviations below its usual price a listing must be (default: 2.0)")
+    parser.add_argument("--sort", choices=["discount", "savings"], default="discount", help="Ranking key (default: discount)")
+    parser.add_argument("-f", "--format", choices=["text", "json", "csv"], default="text", help="Output format (default: text)")
+    parser.add_argument("-o", "--output", help="Write results to this file instead of stdout")
+    parser.add_argument("-w", "--watch", action="store_true", help="Keep polling and print new deals as JSON lines")
+    parser.add_argument("--interval", type=float, default=30, help="Seconds between polls in watch mode (default: 30)")
+    parser.add_argument("--webhook", help="Also POST each new deal as JSON to this URL (watch mode)")
+    parser.add_argument("--alerts-db", action="store_true", help="Also store new deals in the deal_alerts table (watch mode)")
 
     args = parser.parse_args()
-
-    if not args.rarity:
-        parser.print_help()
+    rarities = [r.strip() for r in args.rarity.split(",")] if args.rarity and args.rarity.lower() != "all" else None
+    if args.watch:
+        watch_cheap_cards(
+            rarities, args.language, args.expansion, args.zero, args.game,
+            args.max_ratio, args.min_listings, args.interval, args.webhook, args.alerts_db,
+            not args.no_history, args.min_z
+        )
     else:
-        find_cheap_cards(args.rarity, args.language, args.expansion, args.zero)
+        find_cheap_cards(
+            rarities, args.language, args.expansion, args.zero, args.game,
+            args.max_ratio, args.min_listings, args.sort, args.format, args.output,
+            not args.no_history, args.min_z
+        )
@@ -1,9 +1,6 @@
 import argparse
-import os
 import sys
-import re
 from app.games.fab import FABGame
-from app.core import api
 
 def main():
     parser = argparse.ArgumentParser(description="Generate a CardTrader-ready list of Flesh and Blood cards.")
@@ -17,66 +14,16 @@ def main():
     args = parser.parse_args()
 
     game = FABGame()
-    type_mapping = game.load_cards_mapping()
-    all_identities = sorted(type_mapping.keys(), key=len, reverse=True)
 
-    expansions_to_check = {}
-    if not args.expansion or args.expansion.lower() == 'all':
-        expansions_to_check = game.expansions
-    else:
-        # Match expansion exactly or by partial name
-        for exp_name, exp_id in game.expansions.items():
-            if args.expansion.lower() == exp_name.lower() or args.expansion.lower() in exp_name.lower():
-                expansions_to_check[exp_name] = exp_id
-        
-        if not expansions_to_check:
-            print(f"Error: Expansion '{args.expansion}' not found.")
-            print("Available expansions:", ", ".join(game.expansions.keys()))
-            sys.exit(1)
-
-    # Dictionary to ensure deduplication
-    final_list = {}
-    exp_code_regex = re.compile(r'\s*\([^)]*[A-Z]{3,}[^)]*\)\s*')
-    variant_regex = re.compile(r'\s*-\s*(unlimited|1st edition|rainbow foil|cold foil|foil).*', re.I)
-
-    for exp_name, exp_id in expansions_to_check.items():
-        print(f"Fetching blueprints for {exp_name}...", file=sys.stderr)
-        try:
-            blueprints = api.fetch_blueprints(exp_id)
-            for bp in blueprints:
-                # 1. Rarity Filter
-                bp_rarity = bp.get('fixed_properties', {}).get('fab_rarity', '').lower()
-                if bp_rarity != args.rarity.lower():
-                    continue
-                
-                # 2. Identity Resolution
-                bp_name = bp['name']
-                norm_bp_name = game.normalize_name(bp_name)
-                
-                # Find the most specific identity that is a prefix of the blueprint name
-                identity = None
-                for ident in all_identities:
-                    if norm_bp_name.startswith(ident):
-                        identity = ident
-                        break
-                
-                if not identity:
-                    continue
-                
-                # 3. Class Filter
-                card_types = type_mapping.get(identity, "")
-                if args.class_name.lower() in card_types.lower():
-                    # 4. Deduplication Logic
-                    if args.deduplicate and identity in final_list:
-                        continue
+    expansions_to_check = game.match_expansions(args.expansion)
+    if not expansions_to_check:
+        print(f"Error: Expansion '{args.expansion}' not found.")
+        print("Available expansions:", ", ".join(game.expansions.keys()))
+        sys.exit(1)
 
-                    # Clean name for output
-                    clean_name = exp_code_regex.sub(' ', bp_name)
-                    clean_name = variant_regex.sub('', clean_name).strip()
-                    
-                    final_list[identity] = f"{args.quantity}x {clean_name}"
-        except:
-            continue
+    print(f"Resolving cards across {len(expansions_to_check)} expansion(s)...", file=sys.stderr)
+    entries = game.list_cards(args.class_name, args.rarity, expansions_to_check, args.deduplicate)
+    final_list = {identity: f"{args.quantity}x {e['clean_name']}" for identity, e in entries.items()}
 
     if not final_list:
         print("No cards found matching the criteria.", file=sys.stderr)
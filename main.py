@@ -5,7 +5,12 @@ from app.server import app
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run the CardTrader Hub Dashboard.")
     parser.add_argument("-p", "--port", type=int, default=8000, help="Port to run the server on (default: 8000)")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Number of worker processes (default: 1). Workers share caches through cache.db.")
     args = parser.parse_args()
     
-    # We run the app imported from app.server
-    uvicorn.run(app, host="0.0.0.0", port=args.port)
\ No newline at end of file
+    if args.workers > 1:
+        # Multiple workers need an import string so each process loads its own app
+        uvicorn.run("app.server:app", host="0.0.0.0", port=args.port, workers=args.workers)
+    else:
+        # We run the app imported from app.server
+        uvicorn.run(app, host="0.0.0.0", port=args.port)
\ No newline at end of file
@@ -0,0 +1,78 @@
+import sys
+import csv
+import json
+import argparse
+from app.core import api
+from app.core import pricelist
+from app.games import GAMES
+
+CSV_FIELDS = ["line", "quantity", "input", "match", "score", "name", "expansion", "blueprint_id",
+              "found", "missing", "best_price", "cost", "link"]
+
+def price_list_file(path, game_name="riftbound", zero_only=False, lang_target=None, expansion=None,
+                    fuzzy=True, output_format="text", output=None):
+    if not api.API_TOKEN:
+        print("Error: API_CARDTRADER not found.")
+        return
+
+    game = GAMES[game_name]
+    expansion_ids = None
+    if expansion:
+        expansion_ids = {
+            exp_id for exp_name, exp_id in game.expansions.items()
+            if exp_name.lower() == expansion.lower() or str(exp_id) == expansion
+        }
+        if not expansion_ids:
+            print(f"Error: Unknown expansion '{expansion}'.")
+            print(f"Known names: {', '.join(game.expansions)}")
+            return
+
+    if path == "-":
+        text = sys.stdin.read()
+    else:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+
+    result = pricelist.price_list(game, text, zero_only, lang_target, expansion_ids, fuzzy)
+    for error in result["errors"]:
+        print(f"  Error fetching listings for {error}", file=sys.stderr)
+
+    f = open(output, "w", newline="", encoding="utf-8") if output else sys.stdout
+    try:
+        if output_format == "json":
+            json.dump(result, f, indent=2)
+            f.write("\n")
+        elif output_format == "csv":
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(result["lines"])
+            writer.writerow({"input": "TOTAL", "quantity": result["cards"], "found": result["found"],
+                             "missing": result["missing"], "cost": result["total"]})
+        else:
+            for line in result["lines"]:
+                if not line["match"]:
+                    print(f"{line['quantity']}x {line['input']}: no match", file=f)
+                    continue
+                fuzzy_note = f" (matched '{line['name']}', {line['score']:.2f})" if line["match"] == "fuzzy" else ""
+                missing = f", {line['missing']} missing" if line["missing"] else ""
+                print(f"{line['quantity']}x {line['input']}{fuzzy_note}: {line['cost']:.2f} {result['currency']}{missing}", file=f)
+            print(f"\nTotal: {result['total']:.2f} {result['currency']} for {result['found']}/{result['cards']} cards", file=f)
+    finally:
+        if output:
+            f.close()
+    print(f"{len(result['lines'])} line(s) priced in {result['seconds']}s with {result['upstream_calls']} upstream call(s); "
+          f"{len(result['unmatched'])} unmatched.", file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Price an 'Nx Card Name' list on CardTrader.")
+    parser.add_argument("file", help="List file (e.g. wishlists_content/*.txt or generate_fab_list.py output), '-' for stdin")
+    parser.add_argument("-g", "--game", default="riftbound", choices=list(GAMES), help="Game (default: riftbound)")
+    parser.add_argument("-z", "--zero", action="store_true", help="Only CardTrader Zero compatible listings")
+    parser.add_argument("-l", "--language", help="Language code (e.g., en, fr)")
+    parser.add_argument("-e", "--expansion", help="Only match printings from this expansion (name or ID)")
+    parser.add_argument("--exact", action="store_true", help="Disable fuzzy name matching")
+    parser.add_argument("-f", "--format", choices=["text", "json", "csv"], default="text", help="Output format (default: text)")
+    parser.add_argument("-o", "--output", help="Write results to this file instead of stdout")
+
+    args = parser.parse_args()
+    price_list_file(args.file, args.game, args.zero, args.language, args.expansion, not args.exact, args.format, args.output)
@@ -0,0 +1,22 @@
+import os
+import sys
+
+# Tests run against the repo's data files with throwaway databases and no API pacing;
+# set before any app module reads its configuration
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault('API_RATE_PER_SEC', '0')
+os.environ['SHARED_CACHE_DB'] = ''
+
+import pytest
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """Points the prices database and the rate limiter at fresh files under tmp_path."""
+    from app.core import database as db
+    from app.core import ratelimit
+    monkeypatch.setattr(db, "DB_NAME", str(tmp_path / "prices.db"))
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_DB", str(tmp_path / "ratelimit.db"), raising=False)
+    db.init_db()
+    return db
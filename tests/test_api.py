@@ -0,0 +1,32 @@
+import contextvars
+import threading
+from app.core import api
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {}
+
+def test_count_calls_only_sees_its_own_context(monkeypatch):
+    monkeypatch.setattr(api.session, "get", lambda *args, **kwargs: FakeResponse())
+    call = lambda: api._get("test", "https://api.cardtrader.com/api/v2/test")
+
+    with api.count_calls() as outer:
+        call()
+        # Another thread without this context, e.g. a concurrent run, is not counted
+        other = threading.Thread(target=call)
+        other.start()
+        other.join()
+        # A worker running a copy of the context is
+        worker = threading.Thread(target=contextvars.copy_context().run, args=(call,))
+        worker.start()
+        worker.join()
+        with api.count_calls() as inner:
+            call()
+    assert inner.calls == 1
+    assert outer.calls == 3
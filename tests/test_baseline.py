@@ -0,0 +1,43 @@
+import random
+from app.core import baseline
+from app.core import deals
+from app.games.riftbound import RiftboundGame
+
+def test_update_converges_on_a_level_shift():
+    stats = None
+    for value in [100] * 50 + [200] * 300:
+        stats = baseline.update(stats, value)
+    assert abs(stats["ewma"] - 200) < 0.01
+    assert stats["ewm_var"] < 1
+    # Percentiles settle within one quantile step (BASELINE_QUANTILE_RATE x average) of the value
+    for name in baseline.QUANTILES:
+        assert abs(stats[name] - 200) <= 200 * baseline.BASELINE_QUANTILE_RATE
+    assert stats["samples"] == 350
+
+def test_update_tracks_a_noisy_series():
+    rng = random.Random(0)
+    stats, averaged = None, {name: 0.0 for name in ("ewma", "p10", "p50", "p90")}
+    for i in range(4000):
+        stats = baseline.update(stats, rng.uniform(80, 120))
+        if i >= 2000:
+            for name in averaged:
+                averaged[name] += stats[name] / 2000
+    # Uniform(80, 120): mean 100, 10th/50th/90th percentiles 84/100/116
+    assert abs(averaged["ewma"] - 100) < 2
+    assert abs(averaged["p10"] - 84) < 2
+    assert abs(averaged["p50"] - 100) < 2
+    assert abs(averaged["p90"] - 116) < 2
+
+def _listing(listing_id, price):
+    return {"id": listing_id, "price_cents": price, "quantity": 1, "properties_hash": {"condition": "Near Mint"}}
+
+def test_watcher_records_stats_from_the_first_poll():
+    watcher = deals.DealWatcher(RiftboundGame(), {}, [], history=True)
+    updated = {}
+    assert watcher._diff(1, [_listing(i, 100 + i) for i in range(6)], None, updated) == []
+    assert updated[1]["samples"] == 1
+
+    # Unchanged snapshots are not folded in again
+    updated = {}
+    watcher._diff(1, [_listing(i, 100 + i) for i in range(6)], None, updated)
+    assert updated == {}
@@ -0,0 +1,79 @@
+import itertools
+import random
+from app.core import cart
+from app.games.riftbound import RiftboundGame
+
+SHIPPING, ZERO_SHIPPING = 500, 600
+
+def _random_cart(rng, cards=4, sellers=6):
+    listings_by_bp, wanted = {}, {}
+    zero = {seller: rng.random() < 0.3 for seller in range(sellers)}
+    for bp_id in range(1, cards + 1):
+        wanted[bp_id] = rng.randint(1, 3)
+        listings_by_bp[bp_id] = [
+            {
+                "id": bp_id * 100 + seller,
+                "price_cents": rng.randint(50, 900),
+                "quantity": rng.randint(1, 2),
+                "price_currency": "EUR",
+                "user": {"id": seller, "username": f"seller{seller}", "can_sell_via_hub": zero[seller]},
+                "properties_hash": {"condition": "Near Mint"}
+            }
+            for seller in rng.sample(range(sellers), rng.randint(1, sellers))
+        ]
+    return wanted, listings_by_bp
+
+def _brute_force(wanted, listings_by_bp):
+    """Cheapest total (cents) over every set of parcels that covers as many copies as exist."""
+    group = lambda l: cart.ZERO if l["user"]["can_sell_via_hub"] else l["user"]["id"]
+    groups = sorted({group(l) for ls in listings_by_bp.values() for l in ls}, key=str)
+    best = None
+    for size in range(len(groups) + 1):
+        for opened in itertools.combinations(groups, size):
+            total = sum(ZERO_SHIPPING if g == cart.ZERO else SHIPPING for g in opened)
+            for bp_id, qty in wanted.items():
+                listings = sorted(listings_by_bp[bp_id], key=lambda l: l["price_cents"])
+                need = min(qty, sum(l["quantity"] for l in listings))
+                for l in listings:
+                    if need and group(l) in opened:
+                        take = min(need, l["quantity"])
+                        total += take * l["price_cents"]
+                        need -= take
+                if need:
+                    break
+            else:
+                best = total if best is None else min(best, total)
+    return best
+
+def test_exact_mode_matches_brute_force():
+    game, rng = RiftboundGame(), random.Random(7)
+    for _ in range(40):
+        wanted, listings_by_bp = _random_cart(rng)
+        result = cart.optimize(
+            game, wanted, mode="exact", listings_by_bp=listings_by_bp,
+            seller_shipping=SHIPPING, zero_shipping=ZERO_SHIPPING
+        )
+        assert result["optimal"]
+        assert round(result["total"] * 100) == _brute_force(wanted, listings_by_bp)
+
+def test_exact_mode_is_honored_past_the_auto_threshold(monkeypatch):
+    monkeypatch.setattr(cart, "CART_EXACT_MAX_SELLERS", 1)
+    wanted, listings_by_bp = _random_cart(random.Random(1))
+    result = cart.optimize(RiftboundGame(), wanted, mode="exact", listings_by_bp=listings_by_bp)
+    assert result["mode"] == "exact"
+    assert cart.optimize(RiftboundGame(), wanted, mode="auto", listings_by_bp=listings_by_bp)["mode"] == "heuristic"
+
+def test_exact_mode_handles_thousands_of_groups():
+    # Near-identical prices keep every seller's offer in play: one shipping group per seller
+    rng = random.Random(3)
+    listings = [
+        {"id": seller, "price_cents": rng.randint(100, 110), "quantity": 1, "price_currency": "EUR",
+         "user": {"id": seller, "username": f"seller{seller}", "can_sell_via_hub": False},
+         "properties_hash": {"condition": "Near Mint"}}
+        for seller in range(3000)
+    ]
+    wanted, listings_by_bp = {1: 2}, {1: listings}
+    exact = cart.optimize(RiftboundGame(), wanted, mode="exact", listings_by_bp=listings_by_bp)
+    heuristic = cart.optimize(RiftboundGame(), wanted, mode="heuristic", listings_by_bp=listings_by_bp)
+    assert exact["mode"] == "exact"
+    assert exact["total"] <= heuristic["total"]
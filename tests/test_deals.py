@@ -0,0 +1,23 @@
+from app.core import deals
+from app.games.riftbound import RiftboundGame
+
+def _listing(listing_id, price):
+    return {"id": listing_id, "price_cents": price, "quantity": 1, "properties_hash": {"condition": "Near Mint"}}
+
+def test_watcher_forgets_alerts_for_listings_that_are_gone(monkeypatch):
+    blueprint = {"id": 1, "name": "Test Card", "fixed_properties": {}}
+    snapshots = [
+        [_listing(i, 100) for i in range(6)],
+        [_listing(i, 100) for i in range(6)] + [_listing(6, 10)],
+        [_listing(i, 100) for i in range(6)],
+    ]
+    monkeypatch.setattr(deals.api, "fetch_blueprints", lambda exp_id, max_age=None: [blueprint])
+    monkeypatch.setattr(deals.api, "fetch_expansion_products", lambda exp_id: {"1": snapshots.pop(0)})
+    watcher = deals.DealWatcher(RiftboundGame(), {"Test": 1}, [])
+
+    watcher.poll()
+    assert [deal["listing_id"] for deal in watcher.poll()] == [6]
+    assert watcher._alerted == {(6, 10)}
+    # The sold listing drops out of the next snapshot, and out of the alert memory with it
+    watcher.poll()
+    assert watcher._alerted == set()
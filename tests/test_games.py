@@ -0,0 +1,13 @@
+from app.games.riftbound import RiftboundGame
+
+def test_every_swept_expansion_matches_catalog_cards():
+    game = RiftboundGame()
+    catalog = game.load_catalog()
+    for exp in game.sweep_expansions[1:]:
+        # Same comparison calculate_collection_cost uses for its expansion filter
+        assert any(row['Set'].lower() == exp.lower() for row in catalog), exp
+
+def test_aliased_expansion_is_swept_under_catalog_name():
+    sweep = RiftboundGame().sweep_expansions
+    assert "SFD" in sweep
+    assert "Spiritforged" not in sweep
@@ -0,0 +1,25 @@
+import threading
+from app.core import jobs
+from app.core import ratelimit
+
+def test_same_key_shares_one_job_and_raises_its_priority():
+    started, release, seen = threading.Event(), threading.Event(), []
+
+    def work(progress):
+        seen.append(ratelimit.current_priority())
+        started.set()
+        release.wait(5)
+        seen.append(ratelimit.current_priority())
+        return "done"
+
+    background = jobs.submit(("test", 1), work, priority="background")
+    started.wait(5)
+    interactive = jobs.submit(("test", 1), work)
+    assert interactive["id"] == background["id"]
+    assert interactive["priority"] == "interactive"
+    # A lower-priority caller never lowers it again
+    assert jobs.submit(("test", 1), work, priority="cron")["priority"] == "interactive"
+
+    release.set()
+    assert jobs.wait(background["id"], 5)["result"] == "done"
+    assert seen == ["background", "interactive"]
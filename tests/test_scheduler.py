@@ -0,0 +1,25 @@
+from app.core import scheduler
+from app.games.riftbound import RiftboundGame
+
+VARIANTS = [(1, False, None, False)]
+
+def _planned(game):
+    return {cell for _, _, cell, _ in scheduler.plan({"riftbound": game}, VARIANTS)}
+
+def test_empty_cells_are_not_replanned_until_the_catalog_changes(temp_db, monkeypatch):
+    game = RiftboundGame()
+    cell = (game.rarities[0], game.domains[0], 1, False, None, "SFD", False)
+    assert cell in _planned(game)
+
+    temp_db.mark_empty_cells("riftbound", [cell], game.collection_fingerprint(), game.catalog_fingerprint())
+    assert cell not in _planned(game)
+
+    monkeypatch.setattr(RiftboundGame, "catalog_fingerprint", lambda self: "edited")
+    assert cell in _planned(game)
+
+def test_run_records_empty_outcomes(temp_db, monkeypatch):
+    game = RiftboundGame()
+    monkeypatch.setattr(scheduler, "refresh_cell", lambda *args: "empty")
+    summary = scheduler.run({"riftbound": game}, VARIANTS)
+    assert summary["empty"] == summary["planned"] > 0
+    assert _planned(game) == set()
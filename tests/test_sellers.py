@@ -0,0 +1,30 @@
+import time
+import pytest
+from app.core import api
+from app.core import sellers
+
+@pytest.fixture(autouse=True)
+def empty_index():
+    for index in (sellers._by_seller, sellers._by_blueprint, sellers._profiles):
+        index.clear()
+    yield
+    for index in (sellers._by_seller, sellers._by_blueprint, sellers._profiles):
+        index.clear()
+
+def _listing(seller_id):
+    return {"id": seller_id, "price_cents": 100, "user": {"id": seller_id, "username": f"seller{seller_id}"}}
+
+def test_expired_snapshots_are_pruned_on_ingest(monkeypatch):
+    monkeypatch.setattr(api, "LISTING_CACHE_TTL", 60)
+    now = time.time()
+    sellers.ingest(1, [_listing(10), _listing(11)], now - 50)
+    sellers.ingest(2, [_listing(11)], now - 10)
+    # Too old to index at all
+    sellers.ingest(3, [_listing(12)], now - 120)
+    assert sellers.stats() == {"sellers": 2, "blueprints": 2, "postings": 3}
+
+    monkeypatch.setattr(api, "LISTING_CACHE_TTL", 30)
+    sellers.ingest(4, [_listing(13)], now)
+    assert sellers.missing([1, 2, 3, 4]) == [1, 3]
+    assert sellers.stats() == {"sellers": 2, "blueprints": 2, "postings": 2}
+    assert set(sellers._profiles) == {11, 13}
@@ -0,0 +1,89 @@
+import random
+import sqlite3
+import pytest
+import cron_update
+from app.core import api
+from app.games.riftbound import RiftboundGame
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    """Serves blueprint exports built from the Riftbound catalog and fixed random listings."""
+    game = RiftboundGame()
+    exports = {}
+    for i, row in enumerate(game.load_catalog(), 1):
+        exp_id = game.expansions.get(row['Set'])
+        if exp_id:
+            exports.setdefault(exp_id, []).append({"id": i, "name": row['Name'], "version": None, "expansion_id": exp_id})
+
+    def listings(bp_id):
+        rng = random.Random(bp_id)
+        return [
+            {"id": bp_id * 100 + k, "price_cents": rng.randint(10, 2000), "quantity": rng.randint(1, 3),
+             "price_currency": "EUR", "user": {"id": rng.randint(1, 30), "can_sell_via_hub": True},
+             "properties_hash": {"condition": "Near Mint", "riftbound_language": "en"}}
+            for k in range(rng.randint(0, 4))
+        ]
+
+    def get(url, headers=None, params=None):
+        if url.endswith("/blueprints/export"):
+            return FakeResponse(exports.get(int(params["expansion_id"]), []))
+        if "blueprint_id" in params:
+            return FakeResponse({str(params["blueprint_id"]): listings(int(params["blueprint_id"]))})
+        return FakeResponse({str(bp["id"]): listings(bp["id"]) for bp in exports.get(int(params["expansion_id"]), [])})
+
+    monkeypatch.setattr(api.session, "get", get)
+    api.blueprint_cache.clear()
+    api.listing_cache.clear()
+
+def _rows(db):
+    conn = sqlite3.connect(db.DB_NAME)
+    rows = conn.execute('''
+        SELECT game, rarity, domain, quantity, zero_only, language, expansion, foil, COUNT(*)
+        FROM price_history GROUP BY game, rarity, domain, quantity, zero_only, language, expansion, foil
+    ''').fetchall()
+    sweeps = conn.execute("SELECT id, status FROM sweeps").fetchall()
+    conn.close()
+    return rows, sweeps
+
+def test_resumed_sweep_writes_each_cell_once(temp_db, fake_api, monkeypatch):
+    game = RiftboundGame()
+    cells = sum(
+        1 for exp in game.sweep_expansions
+        for _ in cron_update._shard_cells("riftbound", game, exp, [1], [True], ["en"])
+    )
+    price_cell, priced, interrupt = cron_update._price_cell, [], [True]
+
+    def counted(*args):
+        if interrupt[0] and len(priced) == 25:
+            raise KeyboardInterrupt
+        priced.append(args)
+        return price_cell(*args)
+
+    monkeypatch.setattr(cron_update, "_price_cell", counted)
+    with pytest.raises(KeyboardInterrupt):
+        cron_update.run_update("riftbound", [1], [True], ["en"], full=True)
+    partial, _ = _rows(temp_db)
+    assert partial
+
+    interrupt[0] = False
+    # full=True inserts even unchanged cells, so a cell priced twice would show up as two rows
+    cron_update.run_update("riftbound", [1], [True], ["en"], resume="latest", full=True)
+    rows, sweeps = _rows(temp_db)
+    assert len(sweeps) == 1 and sweeps[0][1] == "done"
+    # Across both runs every cell is priced exactly once
+    assert len(priced) == cells
+    assert len(rows) > len(partial)
+    assert all(count == 1 for *_, count in rows)